@@ -0,0 +1,237 @@
+"""Response analytics computed inside SQLite
+
+Instead of loading and decoding every response in Python, the summary is a
+single statement: it walks json_each(responses.answers) once, through the
+(form_id, submitted_at) index, and aggregates the extracted answers several
+ways. Python only sees one row per question or per distinct answer value. Rows in the compact binary encoding are
+turned back into JSON by a registered function first.
+"""
+import json
+
+import storage
+from metrics import instrument
+from question_ids import CHOICE_TYPES, CHECKBOX_TYPES, NUMERIC_TYPES
+
+# Python truthiness of a json_each row, matching `if answer:` in the app
+SQL_TRUTHY = '''
+    CASE j.type
+        WHEN 'text' THEN j.value != ''
+        WHEN 'integer' THEN j.value != 0
+        WHEN 'array' THEN j.value != '[]'
+        WHEN 'real' THEN j.value != 0
+        WHEN 'null' THEN 0
+        WHEN 'false' THEN 0
+        WHEN 'true' THEN 1
+        ELSE j.value != '{}'
+    END
+'''
+
+# Answers as JSON text; compact rows (see answer_codec) are decoded by a Python function
+SQL_ANSWERS = '''
+    CASE WHEN typeof(r.answers) = 'blob'
+        THEN answers_json(r.form_id, r.form_version, r.answers)
+        ELSE r.answers
+    END
+'''
+
+# The whole summary in one statement. Every answer of the form's responses is
+# extracted once into a materialized CTE, which each UNION ALL branch then
+# aggregates its own way:
+#   overview  per-response answered counts folded into completion and screening tallies
+#   key       per-question presence and truthy counts, plus word totals for text questions
+#   value     counts per distinct scalar answer of choice, numeric and checkbox questions
+#   option    counts per selected option of checkbox answers stored as lists
+SQL_SUMMARY = f'''
+    WITH a AS MATERIALIZED (
+        SELECT r.rowid AS rid, j.key AS key, j.type AS type, j.value AS value, {SQL_TRUTHY} AS truthy
+        FROM responses r LEFT JOIN json_each({SQL_ANSWERS}) j
+        WHERE r.form_id = :form_id
+    )
+    SELECT 'overview', NULL, NULL, NULL,
+        COUNT(*),
+        COALESCE(SUM(n_keys), 0),
+        COALESCE(SUM(n_keys = :total), 0),
+        COALESCE(SUM(n_truthy = :total AND :total > 0), 0),
+        COALESCE(SUM(n_truthy != :total AND n_truthy * 2 > :total), 0)
+    FROM (
+        SELECT COUNT(key) AS n_keys, COALESCE(SUM(truthy), 0) AS n_truthy
+        FROM a GROUP BY rid
+    )
+    UNION ALL
+    SELECT 'key', key, NULL, NULL,
+        COUNT(*),
+        SUM(truthy),
+        SUM(CASE WHEN truthy AND key IN (SELECT value FROM json_each(:text_keys))
+                 THEN word_count(value) END),
+        NULL, NULL
+    FROM a WHERE key IS NOT NULL
+    GROUP BY key
+    UNION ALL
+    SELECT 'value', key, type, value, COUNT(*), NULL, NULL, NULL, NULL
+    FROM a
+    WHERE key IN (SELECT value FROM json_each(:value_keys))
+      AND type NOT IN ('array', 'object')
+      AND truthy
+    GROUP BY key, type, value
+    UNION ALL
+    SELECT 'option', a.key, NULL, o.value, COUNT(DISTINCT a.rid), NULL, NULL, NULL, NULL
+    FROM a, json_each(a.value) o
+    WHERE a.key IN (SELECT value FROM json_each(:checkbox_keys))
+      AND a.type = 'array'
+      AND o.type NOT IN ('array', 'object')
+    GROUP BY a.key, o.value
+'''
+
+SQL_VERSION_COUNTS = '''
+    SELECT form_version, COUNT(*) FROM responses
+    WHERE form_id = ?
+    GROUP BY form_version
+'''
+
+
+def _word_count(value):
+    return len(str(value).split()) if value is not None else 0
+
+
+def _answers_json(form_id, form_version, answers):
+    return json.dumps(storage.decode_stored_answers(form_id, form_version, answers))
+
+
+def _numeric_value(json_type, value):
+    """Numeric value of an answer, or None if the answer isn't numeric"""
+    if json_type in ('integer', 'real'):
+        return float(value)
+    if json_type == 'text':
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+@instrument('analytics.compute_form_summary')
+def compute_form_summary(form):
+    """Aggregate statistics for a form's responses
+
+    Returns a dict with overall counts ('total_responses', 'complete',
+    'passed', 'pending', 'failed', 'avg_answered') and a 'questions' list
+    with one entry per question holding 'response_count' plus
+    'option_counts', 'numeric' or 'text' depending on the question type.
+    """
+    questions = form['questions']
+    total_questions = len(questions)
+    form_id = form['id']
+
+    keys_by_kind = {'choice': [], 'checkbox': [], 'numeric': [], 'text': []}
+    for question in questions:
+        if question['type'] in CHOICE_TYPES:
+            keys_by_kind['choice'].append(question['id'])
+        elif question['type'] in CHECKBOX_TYPES:
+            keys_by_kind['checkbox'].append(question['id'])
+        elif question['type'] in NUMERIC_TYPES:
+            keys_by_kind['numeric'].append(question['id'])
+        else:
+            keys_by_kind['text'].append(question['id'])
+
+    with storage.get_pool().connection() as conn:
+        conn.create_function('word_count', 1, _word_count, deterministic=True)
+        conn.create_function('answers_json', 3, _answers_json, deterministic=True)
+        rows = conn.execute(SQL_SUMMARY, {
+            'form_id': form_id,
+            'total': total_questions,
+            'text_keys': json.dumps(keys_by_kind['text']),
+            # A checkbox answer stored as a single value counts as one selected option
+            'value_keys': json.dumps(keys_by_kind['choice'] + keys_by_kind['numeric'] + keys_by_kind['checkbox']),
+            'checkbox_keys': json.dumps(keys_by_kind['checkbox']),
+        }).fetchall()
+
+    total = key_total = complete = passed = pending = 0
+    key_counts = {}
+    values_by_key = {}
+    checkbox_counts = {key: {} for key in keys_by_kind['checkbox']}
+    for kind, key, json_type, value, n1, n2, n3, n4, n5 in rows:
+        if kind == 'overview':
+            total, key_total, complete, passed, pending = n1, n2, n3, n4, n5
+        elif kind == 'key':
+            # (present, truthy, words)
+            key_counts[key] = (n1, n2 or 0, n3 or 0)
+        elif key in checkbox_counts:
+            counts = checkbox_counts[key]
+            counts[value] = counts.get(value, 0) + n1
+        else:
+            values_by_key.setdefault(key, []).append((json_type, value, n1))
+
+    summary = {
+        'form_id': form_id,
+        'total_questions': total_questions,
+        'total_responses': total,
+        'complete': complete,
+        'passed': passed,
+        'pending': pending,
+        'failed': total - passed - pending,
+        'avg_answered': key_total / total if total else 0,
+        'questions': [],
+    }
+
+    for i, question in enumerate(questions):
+        key = question['id']
+        present, answered, words = key_counts.get(key, (0, 0, 0))
+        entry = {'index': i, 'type': question['type'], 'response_count': present}
+
+        if question['type'] in CHOICE_TYPES:
+            entry['option_counts'] = {
+                value: count for _, value, count in values_by_key.get(key, [])
+            }
+
+        elif question['type'] in CHECKBOX_TYPES:
+            entry['option_counts'] = checkbox_counts.get(key, {})
+
+        elif question['type'] in NUMERIC_TYPES:
+            count = 0
+            value_sum = 0.0
+            minimum = maximum = None
+            distribution = {}
+            for json_type, value, n in values_by_key.get(key, []):
+                number = _numeric_value(json_type, value)
+                if number is None:
+                    continue
+                count += n
+                value_sum += number * n
+                minimum = number if minimum is None else min(minimum, number)
+                maximum = number if maximum is None else max(maximum, number)
+                distribution[number] = distribution.get(number, 0) + n
+            entry['numeric'] = {
+                'count': count,
+                'mean': value_sum / count if count else None,
+                'min': minimum,
+                'max': maximum,
+                'distribution': dict(sorted(distribution.items())),
+            }
+
+        else:
+            entry['text'] = {
+                'answered': answered,
+                'avg_words': words / answered if answered else None,
+            }
+
+        summary['questions'].append(entry)
+
+    return summary
+
+
+@instrument('analytics.count_responses_by_version')
+def count_responses_by_version(form_id):
+    """(version_number, version hash, response count) per published version, newest first
+
+    Responses stored before versioning are reported with version None.
+    """
+    numbers = {}
+    for version in storage.get_form_versions(form_id):
+        # A hash republished later keeps its first number
+        numbers[version['version']] = version['version_number']
+
+    with storage.get_pool().connection() as conn:
+        rows = conn.execute(SQL_VERSION_COUNTS, (form_id,)).fetchall()
+
+    counts = [(numbers.get(version_hash), version_hash, count) for version_hash, count in rows]
+    return sorted(counts, key=lambda c: (c[0] is None, -(c[0] or 0)))
@@ -0,0 +1,172 @@
+"""Compact binary encoding for stored answers
+
+With FORMS_ANSWER_ENCODING=compact, responses submitted against a published
+form version are stored as a small BLOB instead of JSON text. Each answer is
+the question's position in that (immutable) version, a type tag and a
+struct-packed value:
+
+    option     index into the question's options          (choice questions)
+    bitset     one bit per option                         (checkboxes)
+    int/float  native 8-byte values                       (number, scale)
+    text       UTF-8 bytes
+    json       JSON text, for anything else (grids, mixed lists, booleans)
+
+Answers that cannot be represented exactly (keys outside the version, or
+checkbox lists that are not in option order) are stored as JSON text as
+before, so decoding is always lossless. storage decodes either format
+transparently.
+
+Re-encode existing rows that recorded a form version:
+
+    python answer_codec.py compact [form_id...]
+"""
+import sys
+import json
+import struct
+
+CODEC_VERSION = 1
+
+TAG_OPTION = 1
+TAG_BITSET = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_TEXT = 5
+TAG_JSON = 6
+
+OPTION_TYPES = {'multiple-choice', 'dropdown', 'likert-scale'}
+BITSET_TYPES = {'checkboxes'}
+
+_HEADER = struct.Struct('<BH')      # codec version, answer count
+_ENTRY = struct.Struct('<HB')       # question position, tag
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _option_positions(question):
+    return {option: i for i, option in enumerate(question.get('options', []))}
+
+
+def _bitset(question, answer):
+    """Bitset bytes for a checkbox answer, or None if it wouldn't round-trip"""
+    positions = _option_positions(question)
+    indexes = []
+    for option in answer:
+        if not isinstance(option, str) or option not in positions:
+            return None
+        indexes.append(positions[option])
+    # Decoding yields options in option order without repeats
+    if indexes != sorted(set(indexes)):
+        return None
+
+    bits = 0
+    for index in indexes:
+        bits |= 1 << index
+    return bits.to_bytes((len(positions) + 7) // 8, 'little')
+
+
+def _pack_value(question, answer):
+    """(tag, payload bytes) for one answer"""
+    if isinstance(answer, str):
+        if question['type'] in OPTION_TYPES:
+            index = _option_positions(question).get(answer)
+            if index is not None and index <= 0xFFFF:
+                return TAG_OPTION, _U16.pack(index)
+        data = answer.encode('utf-8')
+        return TAG_TEXT, _U32.pack(len(data)) + data
+
+    if isinstance(answer, int) and not isinstance(answer, bool) and INT64_MIN <= answer <= INT64_MAX:
+        return TAG_INT, _I64.pack(answer)
+    if isinstance(answer, float):
+        return TAG_FLOAT, _F64.pack(answer)
+    if isinstance(answer, list) and question['type'] in BITSET_TYPES:
+        bitset = _bitset(question, answer)
+        if bitset is not None:
+            return TAG_BITSET, _U16.pack(len(bitset)) + bitset
+
+    data = json.dumps(answer).encode('utf-8')
+    return TAG_JSON, _U32.pack(len(data)) + data
+
+
+def pack_answers(questions, answers):
+    """Encode id-keyed answers against a form version's questions
+
+    Returns None when the answers can't be encoded exactly; the caller
+    stores them as JSON instead.
+    """
+    position_by_id = {question.get('id'): i for i, question in enumerate(questions)}
+    if len(answers) > 0xFFFF or len(questions) > 0xFFFF:
+        return None
+
+    parts = [_HEADER.pack(CODEC_VERSION, len(answers))]
+    for key, answer in answers.items():
+        position = position_by_id.get(key)
+        if position is None:
+            return None
+        tag, payload = _pack_value(questions[position], answer)
+        parts.append(_ENTRY.pack(position, tag))
+        parts.append(payload)
+    return b''.join(parts)
+
+
+def unpack_answers(questions, data):
+    """Decode a pack_answers blob back to id-keyed answers"""
+    codec_version, count = _HEADER.unpack_from(data, 0)
+    if codec_version != CODEC_VERSION:
+        raise ValueError(f"Unknown answer codec version {codec_version}")
+
+    answers = {}
+    offset = _HEADER.size
+    for _ in range(count):
+        position, tag = _ENTRY.unpack_from(data, offset)
+        offset += _ENTRY.size
+        question = questions[position]
+
+        if tag == TAG_OPTION:
+            (index,) = _U16.unpack_from(data, offset)
+            offset += _U16.size
+            answer = question['options'][index]
+        elif tag == TAG_BITSET:
+            (length,) = _U16.unpack_from(data, offset)
+            offset += _U16.size
+            bits = int.from_bytes(data[offset:offset + length], 'little')
+            offset += length
+            answer = [option for i, option in enumerate(question['options']) if bits >> i & 1]
+        elif tag == TAG_INT:
+            (answer,) = _I64.unpack_from(data, offset)
+            offset += _I64.size
+        elif tag == TAG_FLOAT:
+            (answer,) = _F64.unpack_from(data, offset)
+            offset += _F64.size
+        elif tag in (TAG_TEXT, TAG_JSON):
+            (length,) = _U32.unpack_from(data, offset)
+            offset += _U32.size
+            text = bytes(data[offset:offset + length]).decode('utf-8')
+            offset += length
+            answer = text if tag == TAG_TEXT else json.loads(text)
+        else:
+            raise ValueError(f"Unknown answer tag {tag}")
+
+        answers[question['id']] = answer
+    return answers
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'compact':
+        print(__doc__.strip())
+        return 1
+
+    import storage
+    storage.init_database()
+    form_ids = argv[2:] or [form['id'] for form in storage.get_all_forms()]
+    for form_id in form_ids:
+        converted = storage.compact_stored_answers(form_id)
+        print(f"Re-encoded {converted} response(s) for {form_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,326 @@
+"""Headless JSON API for published forms
+
+A plain ASGI application (no framework dependency) for embedded clients such
+as formgenerator.html and wrapper-example.html, so a respondent costs a few
+small requests instead of a full Streamlit session. Run it with any ASGI
+server, e.g.:
+
+    uvicorn api:app --port 8502
+
+Routes:
+
+    GET  /forms/<form_id>              latest published version (ETag aware)
+    GET  /forms/<form_id>/versions/<v> one published version (immutable, cached forever)
+    POST /forms/<form_id>/visibility   {"answers": {...}} -> visible questions and hidden options
+    POST /forms/<form_id>/responses    {"answers": {...}} -> validated submission (422 lists errors)
+    GET  /forms/<form_id>/export.csv   all responses, streamed (also .jsonl; signed link,
+                                       see exporters.export_link)
+    GET  /metrics                      operation timings in the Prometheus text format
+
+Answers are keyed by question index, as in the Streamlit filler, or by the
+stable question id ("id" in each question of the form definition). POST
+bodies may include the "version" the client rendered; it defaults to the
+latest published version.
+"""
+import os
+import re
+import json
+import asyncio
+from urllib.parse import parse_qs
+
+import storage
+import metrics
+from exporters import STREAMING_FORMATS, check_export_link
+from form_logic import calculate_screening_status, get_compiled_logic
+from question_ids import question_index_by_id
+from submission_queue import start_submission_queue, submit_response
+from validation import REQUIRED_MESSAGE, get_validator
+
+CORS_ORIGIN = os.environ.get('FORMS_API_CORS_ORIGIN', '*')
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Request/response helpers
+async def _read_json(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return payload
+
+
+def _parse_answers(payload, form):
+    """Answers from a request body (keyed by question index or id), keyed by integer question index"""
+    answers = payload.get('answers', {})
+    if not isinstance(answers, dict):
+        raise HTTPError(400, "'answers' must be an object keyed by question index or id")
+
+    index_by_id = question_index_by_id(form['questions'])
+    parsed = {}
+    for key, value in answers.items():
+        if key in index_by_id:
+            parsed[index_by_id[key]] = value
+            continue
+        try:
+            question_idx = int(key)
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"Unknown question: {key!r}")
+        if not 0 <= question_idx < len(form['questions']):
+            raise HTTPError(400, f"Unknown question index: {question_idx}")
+        parsed[question_idx] = value
+    return parsed
+
+
+def _headers(extra=()):
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'access-control-allow-origin', CORS_ORIGIN.encode()),
+    ]
+    headers.extend(extra)
+    return headers
+
+
+async def _send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': _headers(extra_headers) + [(b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _load_published_form(form_id, version=None):
+    if version is not None and not isinstance(version, str):
+        raise HTTPError(400, "'version' must be a string")
+    # Storage calls block, so run them off the event loop
+    definition = await asyncio.to_thread(storage.get_form_definition, form_id)
+    if definition is None:
+        raise HTTPError(404, "Form not found")
+    # Checked for explicit versions too, so unpublishing stops old clients as well
+    if not definition['is_published']:
+        raise HTTPError(403, "This form is not published")
+
+    if version:
+        form = await asyncio.to_thread(storage.get_form_version, form_id, version)
+    else:
+        form = await asyncio.to_thread(storage.get_published_form, form_id)
+    if form is None:
+        raise HTTPError(404, "Form not found")
+    return form
+
+
+def _form_payload(form):
+    return {
+        'id': form['id'],
+        'title': form['title'],
+        'questions': form['questions'],
+        'settings': form['settings'],
+        'version': form['version'],
+        'version_number': form['version_number'],
+    }
+
+
+def _visibility(form, answers):
+    logic = get_compiled_logic(form)
+    visible = logic.skip_logic.visible_questions(answers)
+    hidden = logic.option_rules.hidden_options(answers)
+    return visible, hidden
+
+
+# Handlers
+async def get_form(scope, receive, send, form_id):
+    form = await _load_published_form(form_id)
+    # Versions are immutable, so the content hash is a strong ETag
+    etag = f'"{form["version"]}"'.encode()
+
+    request_headers = dict(scope.get('headers', []))
+    if request_headers.get(b'if-none-match') == etag:
+        await send({
+            'type': 'http.response.start',
+            'status': 304,
+            'headers': _headers([(b'etag', etag)]),
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    await _send_json(send, 200, _form_payload(form), [(b'etag', etag), (b'cache-control', b'no-cache')])
+
+
+async def get_form_version(scope, receive, send, form_id, version):
+    form = await _load_published_form(form_id, version)
+    await _send_json(send, 200, _form_payload(form), [
+        (b'etag', f'"{form["version"]}"'.encode()),
+        (b'cache-control', b'public, max-age=31536000, immutable'),
+    ])
+
+
+async def post_visibility(scope, receive, send, form_id):
+    payload = await _read_json(receive)
+    form = await _load_published_form(form_id, payload.get('version'))
+    answers = _parse_answers(payload, form)
+
+    visible, hidden = _visibility(form, answers)
+    await _send_json(send, 200, {
+        'visible_questions': visible,
+        'hidden_options': {str(idx): sorted(options) for idx, options in hidden.items()},
+    })
+
+
+async def post_response(scope, receive, send, form_id):
+    payload = await _read_json(receive)
+    # Clients send back the version they rendered so indexes resolve against it
+    form = await _load_published_form(form_id, payload.get('version'))
+    answers = _parse_answers(payload, form)
+
+    # Same validator as the Streamlit filler
+    validator = get_validator(form)
+    errors = validator.validate(answers)
+    if errors:
+        await _send_json(send, 422, {
+            'error': "Some answers are missing or invalid",
+            'missing': sorted(idx for idx, message in errors.items() if message == REQUIRED_MESSAGE),
+            'errors': {str(idx): message for idx, message in sorted(errors.items())},
+        })
+        return
+    answers = validator.coerce(answers)
+
+    response_id = await asyncio.to_thread(submit_response, form_id, answers, form['version'])
+
+    result = {
+        'response_id': response_id,
+        'version': form['version'],
+        'message': form['settings'].get('custom_message', 'Thank you for your response!'),
+    }
+    if form['settings'].get('enable_screening', False):
+        result['screening_status'] = calculate_screening_status(answers, len(form['questions']))
+    await _send_json(send, 201, result)
+
+
+async def get_export(scope, receive, send, form_id, export_format):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    expires = query.get('expires', [None])[0]
+    signature = query.get('signature', [None])[0]
+    if not check_export_link(form_id, export_format, expires, signature):
+        raise HTTPError(403, "Export link is invalid or has expired")
+
+    form = await asyncio.to_thread(storage.load_form, form_id)
+    if form is None:
+        raise HTTPError(404, "Form not found")
+
+    iter_chunks, content_type = STREAMING_FORMATS[export_format]
+    chunks = iter_chunks(form)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', f'{content_type}; charset=utf-8'.encode()),
+            (b'content-disposition', f'attachment; filename="responses_{form_id}.{export_format}"'.encode()),
+            (b'cache-control', b'no-store'),
+        ],
+    })
+    # One batch of rows at a time; the iterator holds no connection between batches
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def get_metrics(scope, receive, send):
+    body = metrics.render_prometheus().encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/plain; version=0.0.4; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# ASGI entry point
+ROUTES = [
+    ('GET', re.compile(r'^/metrics/?$'), get_metrics),
+    ('GET', re.compile(r'^/forms/(?P<form_id>[^/]+)/?$'), get_form),
+    ('GET', re.compile(r'^/forms/(?P<form_id>[^/]+)/versions/(?P<version>[^/]+)/?$'), get_form_version),
+    ('GET', re.compile(r'^/forms/(?P<form_id>[^/]+)/export\.(?P<export_format>csv|jsonl)$'), get_export),
+    ('POST', re.compile(r'^/forms/(?P<form_id>[^/]+)/visibility/?$'), post_visibility),
+    ('POST', re.compile(r'^/forms/(?P<form_id>[^/]+)/responses/?$'), post_response),
+]
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await asyncio.to_thread(storage.init_database)
+            await asyncio.to_thread(start_submission_queue)
+            metrics.start_file_exporter()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    path = scope['path']
+
+    if method == 'OPTIONS':
+        # CORS preflight for embedded clients
+        await send({
+            'type': 'http.response.start',
+            'status': 204,
+            'headers': _headers([
+                (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+                (b'access-control-allow-headers', b'content-type, if-none-match'),
+                (b'access-control-max-age', b'86400'),
+            ]),
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    try:
+        path_matched = False
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method == method:
+                with metrics.timed(f'api.{handler.__name__}'):
+                    await handler(scope, receive, send, **match.groupdict())
+                return
+
+        if path_matched:
+            raise HTTPError(405, "Method not allowed")
+        raise HTTPError(404, "Not found")
+    except HTTPError as e:
+        await _send_json(send, e.status, {'error': e.message})
@@ -0,0 +1,5 @@
+"""Offline benchmarks for the form engine and storage
+
+Run from the repository root with `python -m benchmarks.run`; see run.py
+for options. synthetic.py builds the seeded forms and responses.
+"""
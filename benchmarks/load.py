@@ -0,0 +1,317 @@
+"""Load generator: concurrent simulated respondents against a throwaway forms.db
+
+    python -m benchmarks.load [--respondents 50] [--duration 30] [--questions 100]
+                              [--answer-rate 0.9] [--distribution uniform|skewed]
+                              [--think-ms 0] [--preload 0] [--write-behind]
+                              [--no-drafts] [--json FILE]
+
+Each respondent is a thread that fills the form the way the Streamlit
+filler does. It loads the published version, then answers along the skip
+logic path. Every answer updates the visible questions and hidden options
+incrementally and saves a debounced draft. Finally it validates and
+submits. This exercises the same code paths as the app without a browser.
+
+Reported per interaction (load, answer, validate, submit): count and
+p50/p95/p99/max latency. Also reported: submissions per second, and lock
+waits. Lock waits are measured two ways: pool waits (a borrower found
+every pooled connection busy) and a probe thread that times BEGIN
+IMMEDIATE every 50 ms (how long a writer waits for SQLite's write lock).
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict
+
+import storage
+from drafts import DraftWriter, new_draft_token
+from form_logic import get_compiled_logic
+from submission_queue import SubmissionQueue
+from validation import get_validator
+
+from benchmarks.synthetic import make_form, make_answer, populate, temporary_database
+
+PROBE_INTERVAL = 0.05
+INTERACTIONS = ('load', 'answer', 'validate', 'submit')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else 0.0,
+    }
+
+
+class Recorder:
+    """Latencies per interaction, collected from every respondent thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def time(self, interaction, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[interaction].append(elapsed)
+
+    def error(self, kind):
+        with self._lock:
+            self.errors[kind] += 1
+
+
+def choose_answer(question, rng, hidden, distribution):
+    """An answer that respects hidden options ('skewed' favours the first ones)
+
+    None when every option is hidden, as the filler then offers nothing to pick.
+    """
+    options = [option for option in question.get('options', []) if option not in hidden]
+    if question.get('options') and not options:
+        return None
+    if question['type'] in ('multiple-choice', 'dropdown', 'likert-scale') and options:
+        if distribution == 'skewed':
+            return rng.choices(options, weights=[1 / (n + 1) for n in range(len(options))])[0]
+        return rng.choice(options)
+    if question['type'] == 'checkboxes' and options:
+        chosen = set(rng.sample(options, rng.randint(1, min(3, len(options)))))
+        return [option for option in question['options'] if option in chosen]
+    return make_answer(question, rng)
+
+
+class Respondent(threading.Thread):
+    """Fills and submits the form repeatedly until the deadline"""
+
+    def __init__(self, number, form_id, args, recorder, deadline, submit, drafts):
+        super().__init__(name=f'respondent-{number}', daemon=True)
+        self.rng = random.Random(number)
+        self.form_id = form_id
+        self.args = args
+        self.recorder = recorder
+        self.deadline = deadline
+        self.submit = submit
+        self.drafts = drafts
+        self.submitted = 0
+        # An unexpected exception, re-raised by run_load once every thread has stopped
+        self.failure = None
+
+    def think(self):
+        if self.args.think_ms > 0:
+            time.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+
+    def session(self):
+        started = time.perf_counter()
+        published = storage.get_published_form(self.form_id)
+        form = storage.get_form_version(self.form_id, published['version'])
+        logic = get_compiled_logic(form)
+        validator = get_validator(form)
+        answers = {}
+        visible = logic.skip_logic.visible_questions(answers)
+        hidden = logic.option_rules.hidden_options(answers)
+        self.recorder.time('load', started)
+
+        token = new_draft_token()
+        question_idx = 0 if form['questions'] else None
+        while question_idx is not None:
+            question = form['questions'][question_idx]
+            answer = None
+            if question['required'] or self.rng.random() < self.args.answer_rate:
+                answer = choose_answer(question, self.rng, hidden.get(question_idx, ()), self.args.distribution)
+            if answer is not None:
+                self.think()
+                started = time.perf_counter()
+                answers[question_idx] = answer
+                # What set_answer does in the filler
+                changed = {question_idx}
+                hidden = logic.option_rules.update_hidden_options(hidden, answers, changed)
+                hidden, dropped = logic.option_rules.drop_hidden_answers(
+                    answers, hidden, logic.option_rules.dependents.get(question_idx, ()))
+                visible = logic.skip_logic.update_visible_questions(visible, answers, changed | dropped)
+                if self.drafts is not None:
+                    self.drafts.save(token, self.form_id, form['version'], answers)
+                self.recorder.time('answer', started)
+            question_idx = logic.skip_logic.next_question(question_idx, answers)
+
+        started = time.perf_counter()
+        errors = validator.validate(answers)
+        answers = validator.coerce(answers)
+        self.recorder.time('validate', started)
+        if errors:
+            self.recorder.error('invalid')
+
+        self.think()
+        started = time.perf_counter()
+        self.submit(self.form_id, answers, form['version'])
+        if self.drafts is not None:
+            self.drafts.discard(token)
+        self.recorder.time('submit', started)
+        self.submitted += 1
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            try:
+                self.session()
+            except sqlite3.OperationalError as e:
+                self.recorder.error('locked' if 'locked' in str(e) else 'operational')
+            except OSError:
+                # Appending to the write-behind spool failed
+                self.recorder.error('spool')
+            except Exception as e:
+                # A bug in the generator or the app, not load: stop and report it
+                self.failure = e
+                return
+
+
+class LockProbe(threading.Thread):
+    """Samples how long BEGIN IMMEDIATE waits for the database write lock"""
+
+    def __init__(self, path, stop):
+        super().__init__(name='lock-probe', daemon=True)
+        self.path = path
+        self.stop = stop
+        self.waits = []
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=storage.BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        try:
+            while not self.stop.wait(PROBE_INTERVAL):
+                started = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                except sqlite3.OperationalError:
+                    self.waits.append(time.perf_counter() - started)
+                    continue
+                self.waits.append(time.perf_counter() - started)
+                conn.execute('ROLLBACK')
+        finally:
+            conn.close()
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:9.2f}"
+
+
+def print_report(report):
+    print(f"{report['respondents']} respondents, {report['duration']:.1f} s, "
+          f"{report['questions']} questions, write-behind {'on' if report['write_behind'] else 'off'}")
+    print(f"{'interaction':<10} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, summary in report['latency'].items():
+        print(f"{name:<10} {summary['count']:>8} " + ' '.join(
+            format_ms(summary[key]) for key in ('p50', 'p95', 'p99', 'max')))
+    print(f"submissions: {report['submissions']} ({report['submissions_per_second']:.1f}/s)")
+    probe = report['lock_probe']
+    print(f"write lock wait (probe): p50 {probe['p50'] * 1000:.2f} ms, p95 {probe['p95'] * 1000:.2f} ms, "
+          f"p99 {probe['p99'] * 1000:.2f} ms, max {probe['max'] * 1000:.2f} ms over {probe['count']} samples")
+    print(f"pool waits: {report['pool_waits']} ({report['pool_wait_seconds']:.3f} s total)")
+    if report['errors']:
+        print("errors: " + ', '.join(f"{kind} {count}" for kind, count in report['errors'].items()))
+
+
+def run_load(args):
+    with temporary_database() as path:
+        form = make_form(args.questions, rule_density=args.rule_density, seed=args.seed)
+        populate(form, args.preload, seed=args.seed)
+
+        drafts = None if args.no_drafts else DraftWriter().start()
+        submission_queue = None
+        if args.write_behind:
+            spool_path = os.path.join(os.path.dirname(path), 'responses.spool')
+            submission_queue = SubmissionQueue(spool_path=spool_path).start()
+            submit = submission_queue.submit
+        else:
+            submit = storage.save_response
+
+        recorder = Recorder()
+        stop_probe = threading.Event()
+        probe = LockProbe(path, stop_probe)
+        pool = storage.get_pool()
+        waits_before, wait_seconds_before = pool.waits, pool.wait_seconds
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        respondents = [
+            Respondent(n, form['id'], args, recorder, deadline, submit, drafts)
+            for n in range(args.respondents)
+        ]
+        probe.start()
+        for respondent in respondents:
+            respondent.start()
+        for respondent in respondents:
+            respondent.join()
+        failures = [respondent.failure for respondent in respondents if respondent.failure]
+        if submission_queue is not None and not failures:
+            # Submissions/sec counts committed rows, so wait for the writer to drain
+            submission_queue.flush()
+        elapsed = time.monotonic() - started
+        stop_probe.set()
+        probe.join()
+
+        if drafts is not None:
+            drafts.stop()
+        if submission_queue is not None:
+            submission_queue.stop()
+        if failures:
+            raise failures[0]
+
+        submissions = sum(respondent.submitted for respondent in respondents)
+        return {
+            'respondents': args.respondents,
+            'duration': elapsed,
+            'questions': args.questions,
+            'write_behind': args.write_behind,
+            'latency': {
+                name: latency_summary(recorder.latencies[name])
+                for name in INTERACTIONS if recorder.latencies[name]
+            },
+            'submissions': submissions,
+            'submissions_per_second': submissions / elapsed if elapsed else 0.0,
+            'lock_probe': latency_summary(probe.waits),
+            'pool_waits': pool.waits - waits_before,
+            'pool_wait_seconds': pool.wait_seconds - wait_seconds_before,
+            'errors': dict(recorder.errors),
+        }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--respondents', type=int, default=50, help="concurrent simulated respondents")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run")
+    parser.add_argument('--questions', type=int, default=100, help="questions in the synthetic form")
+    parser.add_argument('--rule-density', type=float, default=0.3, help="fraction of questions with rules")
+    parser.add_argument('--answer-rate', type=float, default=0.9, help="chance an optional question is answered")
+    parser.add_argument('--distribution', choices=('uniform', 'skewed'), default='uniform',
+                        help="how choice answers are picked")
+    parser.add_argument('--think-ms', type=float, default=0.0, help="mean pause before each answer and submit")
+    parser.add_argument('--preload', type=int, default=0, help="responses stored before the run")
+    parser.add_argument('--write-behind', action='store_true', help="submit through the write-behind queue")
+    parser.add_argument('--no-drafts', action='store_true', help="don't save drafts while answering")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args(argv[1:])
+
+    report = run_load(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,365 @@
+"""Run the benchmark suite and record the results
+
+    python -m benchmarks.run [--quick] [--questions 10,100,1000]
+                             [--responses 1000,100000] [--only SUBSTRING]
+                             [--output FILE] [--compare FILE]
+
+Everything runs offline against a temporary forms.db. Results are written
+as JSON (by default to benchmarks/results/<commit>.json). Pass
+--compare with an earlier results file to print the change in median
+time for every benchmark. Changes beyond --threshold (10% by default) are
+flagged.
+
+The startup group times a respondent's first page view. It imports
+streamlit_app.py's module-level imports in a fresh interpreter and warns if
+that loads viewer-only modules such as pandas. It also times the schema
+check and the first, uncached form load.
+"""
+import os
+import sys
+import ast
+import json
+import time
+import random
+import argparse
+import platform
+import sqlite3
+import statistics
+import subprocess
+from datetime import datetime
+
+import storage
+import stats
+import analytics
+import form_logic
+import validation
+from exporters import iter_csv_chunks, iter_jsonl_chunks
+from form_logic import CompiledForm, check_skip_logic, should_hide_option, get_compiled_logic
+from validation import FormValidator, get_validator
+
+from benchmarks.synthetic import make_form, make_answers, iter_records, populate, temporary_database
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+ANSWER_SETS = 50
+SUBMISSIONS = 200
+BATCH_RECORDS = 500
+STORAGE_QUESTIONS = 50
+# Loading every response into dicts is the slow path being measured; skip it above this
+FULL_LOAD_LIMIT = 100000
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_REPEAT = 5
+# Modules only the response viewer needs; the app must not load them at import time
+VIEWER_ONLY_MODULES = ('pandas', 'exporters')
+
+
+def measure(fn, repeat=5, number=1, items=1):
+    """Time fn; min/median/mean are seconds per call, per_item divides the median by items"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return summarize(times, number, items)
+
+
+def summarize(times, number=1, items=1):
+    median = statistics.median(times)
+    return {
+        'min': min(times),
+        'median': median,
+        'mean': statistics.fmean(times),
+        'repeat': len(times),
+        'number': number,
+        'items': items,
+        'per_item': median / items,
+    }
+
+
+# The filler's original per-question loops, kept to time check_skip_logic and should_hide_option
+def _legacy_visible(questions, answers):
+    visible = []
+    current_idx = 0
+    while current_idx < len(questions):
+        visible.append(current_idx)
+        if current_idx in answers:
+            skip_target = check_skip_logic(questions[current_idx], answers[current_idx], questions)
+            if skip_target == "end":
+                break
+            elif skip_target is not None and skip_target > current_idx:
+                current_idx = skip_target
+                continue
+        current_idx += 1
+    return visible
+
+
+def _legacy_hidden(questions, visible, answers):
+    hidden = {}
+    for question_idx in visible:
+        question = questions[question_idx]
+        for option in question.get('options', []):
+            if should_hide_option(question, option, answers, questions):
+                hidden.setdefault(question_idx, set()).add(option)
+    return hidden
+
+
+def engine_benchmarks(num_questions):
+    """Filler-side logic for one form size; no database involved"""
+    form = make_form(num_questions)
+    questions = form['questions']
+    rng = random.Random(1)
+    answer_sets = [make_answers(form, rng) for _ in range(ANSWER_SETS)]
+    logic = CompiledForm(questions)
+    validator = FormValidator(form)
+    visible_sets = [logic.skip_logic.visible_questions(answers) for answers in answer_sets]
+    hidden_sets = [logic.option_rules.hidden_options(answers) for answers in answer_sets]
+    # One edit per answer set, to a question in the middle of its visible path
+    edits = [visible[len(visible) // 2] for visible in visible_sets]
+
+    def update_visible():
+        for answers, visible, changed in zip(answer_sets, visible_sets, edits):
+            logic.skip_logic.update_visible_questions(visible, answers, {changed})
+
+    def update_hidden():
+        for answers, hidden, changed in zip(answer_sets, hidden_sets, edits):
+            logic.option_rules.update_hidden_options(hidden, answers, {changed})
+
+    tag = f"[q={num_questions}]"
+    return {
+        f"engine.compile{tag}": measure(lambda: (CompiledForm(questions), FormValidator(form))),
+        f"engine.visible.legacy{tag}": measure(
+            lambda: [_legacy_visible(questions, answers) for answers in answer_sets], items=ANSWER_SETS),
+        f"engine.visible.compiled{tag}": measure(
+            lambda: [logic.skip_logic.visible_questions(answers) for answers in answer_sets], items=ANSWER_SETS),
+        f"engine.visible.update{tag}": measure(update_visible, items=ANSWER_SETS),
+        f"engine.hidden.legacy{tag}": measure(
+            lambda: [_legacy_hidden(questions, visible, answers)
+                     for answers, visible in zip(answer_sets, visible_sets)], items=ANSWER_SETS),
+        f"engine.hidden.compiled{tag}": measure(
+            lambda: [logic.option_rules.hidden_options(answers) for answers in answer_sets], items=ANSWER_SETS),
+        f"engine.hidden.update{tag}": measure(update_hidden, items=ANSWER_SETS),
+        f"engine.validate{tag}": measure(
+            lambda: [validator.validate(answers) for answers in answer_sets], items=ANSWER_SETS),
+    }
+
+
+def submission_benchmarks(num_questions=STORAGE_QUESTIONS):
+    """Single and batched submissions into an empty database"""
+    results = {}
+    with temporary_database():
+        form = populate(make_form(num_questions), 0)
+        version = storage.get_published_form(form['id'])['version']
+        rng = random.Random(2)
+        answer_sets = [make_answers(form, rng) for _ in range(SUBMISSIONS)]
+
+        def save_each():
+            for answers in answer_sets:
+                storage.save_response(form['id'], answers, version)
+
+        # Generated up front so only the inserts are timed; one batch per repeat
+        batches = iter([
+            list(iter_records(form, BATCH_RECORDS, seed=seed, form_version=version))
+            for seed in range(3)
+        ])
+
+        def save_batch():
+            storage.save_responses_batch(next(batches))
+
+        tag = f"[q={num_questions}]"
+        results[f"submit.save_response{tag}"] = measure(save_each, repeat=3, items=SUBMISSIONS)
+        results[f"submit.batch{tag}"] = measure(save_batch, repeat=3, items=BATCH_RECORDS)
+    return results
+
+
+def storage_benchmarks(num_responses, num_questions=STORAGE_QUESTIONS):
+    """Bulk load, analytics, paging and export over num_responses stored responses"""
+    results = {}
+    tag = f"[q={num_questions},r={num_responses}]"
+    with temporary_database():
+        start = time.perf_counter()
+        form = populate(make_form(num_questions), num_responses)
+        elapsed = time.perf_counter() - start
+        results[f"storage.bulk_insert{tag}"] = {
+            'min': elapsed, 'median': elapsed, 'mean': elapsed, 'repeat': 1, 'number': 1,
+            'items': num_responses, 'per_item': elapsed / max(num_responses, 1),
+        }
+
+        def consume(chunks):
+            for _ in chunks:
+                pass
+
+        # Full scans of large response sets take seconds; one run is enough
+        scan_repeat = 3 if num_responses <= 10000 else 1
+
+        results[f"analytics.sql_summary{tag}"] = measure(
+            lambda: analytics.compute_form_summary(form), repeat=scan_repeat)
+        results[f"stats.rebuild{tag}"] = measure(
+            lambda: stats.rebuild_form_stats(form['id']), repeat=scan_repeat)
+        results[f"stats.summary{tag}"] = measure(lambda: stats.get_form_summary(form))
+        results[f"storage.response_page{tag}"] = measure(
+            lambda: storage.get_response_page(form['id'], len(form['questions'])))
+        if num_responses <= FULL_LOAD_LIMIT:
+            results[f"storage.all_responses{tag}"] = measure(
+                lambda: storage.get_form_responses(form['id']), repeat=scan_repeat, items=max(num_responses, 1))
+        results[f"export.csv{tag}"] = measure(
+            lambda: consume(iter_csv_chunks(form)), repeat=scan_repeat, items=max(num_responses, 1))
+        results[f"export.jsonl{tag}"] = measure(
+            lambda: consume(iter_jsonl_chunks(form)), repeat=scan_repeat, items=max(num_responses, 1))
+    return results
+
+
+def app_imports():
+    """Modules streamlit_app.py imports at module level, except streamlit itself"""
+    with open(os.path.join(REPO_ROOT, 'streamlit_app.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return [module for module in dict.fromkeys(modules) if module.split('.')[0] != 'streamlit']
+
+
+def import_time(modules):
+    """Seconds to import modules in a fresh interpreter, and which viewer-only modules got loaded"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"for name in {modules!r}: __import__(name)\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(elapsed, *[name for name in {VIEWER_ONLY_MODULES!r} if name in sys.modules])\n"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def startup_benchmarks(num_questions=STORAGE_QUESTIONS):
+    """What a respondent's first page view costs: imports, schema check and the first form load"""
+    results = {}
+    modules = app_imports()
+    timings = [import_time(modules) for _ in range(IMPORT_REPEAT)]
+    results["startup.import_app_modules"] = summarize([elapsed for elapsed, _ in timings])
+    loaded = timings[0][1]
+    if loaded:
+        print(f"warning: importing the app loads viewer-only modules: {', '.join(loaded)}", file=sys.stderr)
+
+    with temporary_database():
+        form = populate(make_form(num_questions), 0)
+
+        def first_load():
+            published = storage.get_published_form(form['id'])
+            snapshot = storage.get_form_version(form['id'], published['version'])
+            get_compiled_logic(snapshot)
+            get_validator(snapshot)
+
+        def cold_first_load():
+            storage._form_cache.clear()
+            storage._version_cache.clear()
+            form_logic._compiled_cache.clear()
+            validation._validator_cache.clear()
+            first_load()
+
+        tag = f"[q={num_questions}]"
+        # Paid on every rerun before schema setup moved to once per process
+        results["startup.init_database"] = measure(storage.init_database, repeat=20)
+        results[f"startup.first_load.cold{tag}"] = measure(cold_first_load, repeat=20)
+        results[f"startup.first_load.warm{tag}"] = measure(first_load, repeat=20)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def print_results(results, baseline=None, threshold=0.10):
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = f"{name:<{width}}  {format_seconds(result['median']):>10}"
+        if result['items'] > 1:
+            line += f"  {format_seconds(result['per_item']):>10}/item  {1 / result['per_item']:>12,.0f} items/s"
+        if baseline and name in baseline:
+            change = result['median'] / baseline[name]['median'] - 1
+            flag = ''
+            if change > threshold:
+                flag = '  SLOWER'
+            elif change < -threshold:
+                flag = '  faster'
+            line += f"  {change:+.1%}{flag}"
+        print(line)
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--questions', type=parse_sizes, default=[10, 100, 1000],
+                        help="form sizes for the engine benchmarks")
+    parser.add_argument('--responses', type=parse_sizes, default=[1000, 100000],
+                        help="stored response counts for the storage benchmarks (e.g. 1000,1000000)")
+    parser.add_argument('--quick', action='store_true', help="small sizes only (10,100 questions; 1000 responses)")
+    parser.add_argument('--only', default='', help="run only benchmark groups whose name contains this")
+    parser.add_argument('--output', help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative change to flag (default 0.10)")
+    args = parser.parse_args(argv[1:])
+
+    if args.quick:
+        args.questions = [10, 100]
+        args.responses = [1000]
+
+    groups = [("startup", startup_benchmarks)]
+    groups += [(f"engine q={q}", lambda q=q: engine_benchmarks(q)) for q in args.questions]
+    groups.append(("submit", submission_benchmarks))
+    groups += [(f"storage r={r}", lambda r=r: storage_benchmarks(r)) for r in args.responses]
+
+    results = {}
+    for name, run in groups:
+        if args.only and args.only not in name:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results.update(run())
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline, args.threshold)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'commit': commit,
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'argv': argv[1:],
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,167 @@
+"""Synthetic forms, answers and response sets for benchmarks
+
+Everything is generated from a seed, so two runs (or two commits) time the
+same workload. Forms mix every answerable question type; a rule_density
+fraction of questions carry skip rules or option hiding rules.
+"""
+import os
+import uuid
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import storage
+from form_logic import CompiledSkipLogic
+
+QUESTION_MIX = [
+    'short-text', 'paragraph', 'multiple-choice', 'checkboxes', 'dropdown',
+    'number', 'email', 'scale', 'likert-scale',
+]
+CHOICE_TYPES = {'multiple-choice', 'dropdown', 'likert-scale'}
+OPTION_COUNT = 5
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def _skip_target(rng, question_idx, num_questions):
+    if rng.random() < 0.02:
+        return 'end'
+    return min(num_questions - 1, question_idx + rng.randint(2, 10))
+
+
+def make_form(num_questions, rule_density=0.3, seed=0, form_id=None):
+    """A published form of num_questions questions with dense skip and option rules"""
+    rng = random.Random(seed)
+    questions = []
+    choice_indexes = []
+
+    for i in range(num_questions):
+        q_type = QUESTION_MIX[rng.randrange(len(QUESTION_MIX))]
+        question = {
+            'id': f"q_{i:08x}",
+            'text': f"Question {i + 1}",
+            'description': '',
+            'type': q_type,
+            'required': rng.random() < 0.3,
+        }
+        if q_type in CHOICE_TYPES or q_type == 'checkboxes':
+            question['options'] = [f"Option {n + 1}" for n in range(OPTION_COUNT)]
+        elif q_type == 'scale':
+            question['options'] = [str(n) for n in range(1, 11)]
+
+        # Skip rules jump forward a few questions; "end" is rare so forms stay long
+        if rng.random() < rule_density and i < num_questions - 1:
+            if q_type in CHOICE_TYPES:
+                question['skipLogic'] = [
+                    {'option': option, 'target': _skip_target(rng, i, num_questions)}
+                    for option in rng.sample(question['options'], 2)
+                ]
+            elif q_type in ('number', 'scale'):
+                high, low = (90, 10) if q_type == 'number' else (9, 2)
+                question['skipLogic'] = [
+                    {'operator': 'greater', 'value': high, 'target': _skip_target(rng, i, num_questions)},
+                    {'operator': 'less', 'value': low, 'target': _skip_target(rng, i, num_questions)},
+                ]
+
+        # Option rules hide options depending on an earlier choice question
+        if 'options' in question and q_type != 'scale' and choice_indexes and rng.random() < rule_density:
+            rules = []
+            for _ in range(rng.randint(1, 3)):
+                source_idx = rng.choice(choice_indexes)
+                rules.append({
+                    'sourceQuestion': source_idx,
+                    'sourceValue': rng.choice(questions[source_idx]['options']),
+                    'hiddenOptions': rng.sample(question['options'], 2),
+                })
+            question['optionRules'] = rules
+
+        if q_type in CHOICE_TYPES or q_type == 'checkboxes':
+            choice_indexes.append(i)
+        questions.append(question)
+
+    return {
+        'id': form_id or f"bench_{num_questions}_{seed}",
+        'title': f"Benchmark form ({num_questions} questions)",
+        'questions': questions,
+        'is_published': True,
+        'settings': {'custom_message': 'Thanks!', 'enable_screening': True},
+    }
+
+
+def make_answer(question, rng):
+    q_type = question['type']
+    if q_type in CHOICE_TYPES:
+        return rng.choice(question['options'])
+    if q_type == 'checkboxes':
+        count = rng.randint(1, 3)
+        chosen = set(rng.sample(question['options'], count))
+        return [option for option in question['options'] if option in chosen]
+    if q_type == 'number':
+        return rng.randint(1, 100)
+    if q_type == 'scale':
+        return rng.randint(1, 10)
+    if q_type == 'email':
+        return f"user{rng.randrange(100000)}@example.com"
+    words = rng.randint(1, 30 if q_type == 'paragraph' else 6)
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_answers(form, rng, answer_rate=0.9, skip_logic=None):
+    """Index-keyed answers along the path the skip logic takes for them"""
+    skip_logic = skip_logic or CompiledSkipLogic(form['questions'])
+    answers = {}
+    question_idx = 0 if form['questions'] else None
+    while question_idx is not None:
+        if rng.random() < answer_rate:
+            answers[question_idx] = make_answer(form['questions'][question_idx], rng)
+        question_idx = skip_logic.next_question(question_idx, answers)
+    return answers
+
+
+def iter_records(form, count, seed=0, form_version=None, start=None):
+    """Response records for storage.save_responses_batch / save_responses_bulk"""
+    rng = random.Random(seed)
+    skip_logic = CompiledSkipLogic(form['questions'])
+    submitted = start or datetime(2024, 1, 1)
+    for _ in range(count):
+        submitted += timedelta(seconds=rng.randint(1, 120))
+        yield {
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'form_id': form['id'],
+            'form_version': form_version,
+            'answers': make_answers(form, rng, skip_logic=skip_logic),
+            'submitted_at': str(submitted),
+        }
+
+
+def populate(form, num_responses, seed=0, chunk_size=10000):
+    """Save form (published) and bulk insert num_responses responses; returns the stored form"""
+    storage.save_form(form)
+    version = storage.get_published_form(form['id'])['version']
+    stored = storage.get_form_definition(form['id'])
+
+    chunk = []
+    for record in iter_records(stored, num_responses, seed=seed, form_version=version):
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            storage.save_responses_bulk(stored, chunk)
+            chunk = []
+    if chunk:
+        storage.save_responses_bulk(stored, chunk)
+    return stored
+
+
+@contextmanager
+def temporary_database():
+    """Point storage at a fresh forms.db in a temporary directory for the duration"""
+    previous = storage.DB_PATH
+    directory = tempfile.mkdtemp(prefix='forms-bench-')
+    path = os.path.join(directory, 'forms.db')
+    storage.set_database_path(path)
+    try:
+        storage.init_database()
+        yield path
+    finally:
+        storage.set_database_path(previous)
+        shutil.rmtree(directory, ignore_errors=True)
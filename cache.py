@@ -0,0 +1,63 @@
+"""Small in-process LRU shared by the storage layer, form logic and validation
+
+Entries are keyed by form id or (form id, version) and tagged with a
+value that changes with the form (last_modified, version hash), so a
+stale entry reads as a miss.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Number of entries each cache keeps
+FORM_CACHE_SIZE = int(os.environ.get('FORMS_CACHE_SIZE', '256'))
+
+
+class FormCache:
+    """LRU of parsed form definitions keyed by form id and last_modified"""
+
+    def __init__(self, size=FORM_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, form_id, last_modified):
+        with self._lock:
+            entry = self._entries.get(form_id)
+            if entry is None or entry[0] != last_modified:
+                return None
+            self._entries.move_to_end(form_id)
+            return entry[1]
+
+    def put(self, form_id, last_modified, form):
+        with self._lock:
+            self._entries[form_id] = (last_modified, form)
+            self._entries.move_to_end(form_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, form_id):
+        with self._lock:
+            self._entries.pop(form_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def form_cache_key(form):
+    """(key, tag) to cache something derived from a form under, or None if uncacheable
+
+    Published versions are immutable, so each (form id, version) gets its own
+    entry and never goes stale; live definitions share one entry per form id,
+    tagged with last_modified.
+    """
+    form_id = form.get('id')
+    if form_id is None:
+        return None
+    version = form.get('version')
+    if version is not None:
+        return (form_id, version), version
+    last_modified = form.get('last_modified')
+    if last_modified is None:
+        return None
+    return form_id, last_modified
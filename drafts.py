@@ -0,0 +1,192 @@
+"""Server-side drafts of partially filled forms
+
+The filler saves a respondent's answers (and wizard page) as a draft under
+a resume token that is carried in the page URL (?draft=<token>). Opening
+that URL in a new session restores the answers, so progress survives a
+closed tab or a restarted server.
+
+Writes are debounced: save_draft only records the latest state of each
+draft in memory, and a background thread upserts whatever changed every
+FORMS_DRAFT_SAVE_INTERVAL seconds, so a burst of edits costs one write.
+Discarding a draft on submit is deferred the same way: the token is
+forgotten in memory at once and deleted from the database on the next flush.
+The same thread deletes drafts not updated for FORMS_DRAFT_TTL_DAYS days,
+once every FORMS_DRAFT_SWEEP_INTERVAL seconds. To sweep from cron instead:
+
+    python drafts.py sweep [ttl_days]
+"""
+import os
+import sys
+import time
+import atexit
+import logging
+import secrets
+import threading
+from datetime import timedelta
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+SAVE_INTERVAL = float(os.environ.get('FORMS_DRAFT_SAVE_INTERVAL', '2.0'))
+TTL_DAYS = float(os.environ.get('FORMS_DRAFT_TTL_DAYS', '30'))
+SWEEP_INTERVAL = float(os.environ.get('FORMS_DRAFT_SWEEP_INTERVAL', '3600'))
+
+
+def new_draft_token():
+    return secrets.token_urlsafe(16)
+
+
+class DraftWriter:
+    """Coalesces draft updates in memory and writes them from a background thread"""
+
+    def __init__(self, save_interval=SAVE_INTERVAL, ttl_days=TTL_DAYS, sweep_interval=SWEEP_INTERVAL):
+        self.save_interval = save_interval
+        self.ttl = timedelta(days=ttl_days)
+        self.sweep_interval = sweep_interval
+
+        # Latest unsaved state per token
+        self._pending = {}
+        # Tokens discarded since the last flush, deleted from the database by the next one
+        self._discarded = set()
+        self._lock = threading.Lock()
+        # Serializes flushes, so a discard queued behind an in-flight write is applied after it
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._next_sweep = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='draft-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def save(self, token, form_id, form_version, answers, pages=None):
+        """Record the current state of a draft; it is written on the next flush"""
+        with self._lock:
+            self._discarded.discard(token)
+            self._pending[token] = {
+                'token': token,
+                'form_id': form_id,
+                'form_version': form_version,
+                'answers': dict(answers),
+                'pages': list(pages) if pages is not None else None,
+            }
+
+    def load(self, token):
+        """Latest state of a draft, including changes not written yet"""
+        with self._lock:
+            if token in self._discarded:
+                return None
+            pending = self._pending.get(token)
+        if pending is not None:
+            return dict(pending)
+        return storage.load_draft(token)
+
+    def discard(self, token):
+        """Forget a draft, e.g. once the response has been submitted
+
+        Doesn't touch the database; the delete is written by the next flush.
+        """
+        with self._lock:
+            self._pending.pop(token, None)
+            self._discarded.add(token)
+
+    def flush(self):
+        """Write every pending draft and queued discard now; returns how many drafts were written"""
+        with self._write_lock:
+            with self._lock:
+                drafts, self._pending = self._pending, {}
+                # Left in place until deleted, so load() doesn't read them back meanwhile
+                discarded = set(self._discarded)
+            written = 0
+            if drafts:
+                try:
+                    written = storage.save_drafts(list(drafts.values()))
+                except Exception:
+                    # Keep them for the next flush unless they were updated or discarded meanwhile
+                    with self._lock:
+                        for token, draft in drafts.items():
+                            if token not in self._discarded:
+                                self._pending.setdefault(token, draft)
+                    raise
+            if discarded:
+                storage.delete_drafts(discarded)
+                with self._lock:
+                    self._discarded -= discarded
+            return written
+
+    def sweep(self):
+        """Delete expired drafts; returns how many"""
+        return storage.delete_expired_drafts(self.ttl)
+
+    def _run(self):
+        while not self._stopping.wait(self.save_interval):
+            try:
+                self.flush()
+                if time.monotonic() >= self._next_sweep:
+                    self._next_sweep = time.monotonic() + self.sweep_interval
+                    swept = self.sweep()
+                    if swept:
+                        logger.info("Deleted %d expired draft(s)", swept)
+            except Exception:
+                logger.exception("Writing drafts failed; retrying")
+
+    def stop(self, timeout=10.0):
+        """Stop the writer thread and write what is still pending"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+
+_draft_writer = None
+_draft_writer_lock = threading.Lock()
+
+
+def get_draft_writer():
+    """Process-wide draft writer, started on first use and flushed at exit"""
+    global _draft_writer
+    if _draft_writer is None:
+        with _draft_writer_lock:
+            if _draft_writer is None:
+                _draft_writer = DraftWriter().start()
+                atexit.register(_draft_writer.stop)
+    return _draft_writer
+
+
+def save_draft(token, form_id, form_version, answers, pages=None, flush=False):
+    """Save a draft, debounced unless flush is set"""
+    writer = get_draft_writer()
+    writer.save(token, form_id, form_version, answers, pages)
+    if flush:
+        writer.flush()
+
+
+def load_draft(token):
+    return get_draft_writer().load(token)
+
+
+def discard_draft(token):
+    get_draft_writer().discard(token)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'sweep':
+        print(__doc__.strip())
+        return 1
+
+    ttl_days = float(argv[2]) if len(argv) > 2 else TTL_DAYS
+    storage.init_database()
+    swept = storage.delete_expired_drafts(timedelta(days=ttl_days))
+    print(f"Deleted {swept} expired draft(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,327 @@
+"""Response exports that stream rows instead of building them in memory
+
+CSV and JSON Lines use only the standard library. Parquet and Arrow IPC need
+pyarrow, which is installed with Streamlit; it is imported on first use.
+
+CSV and JSON Lines can also be streamed over HTTP by the JSON API (see
+api.py). The download links are signed with FORMS_EXPORT_SECRET and
+expire, because the API is otherwise open to respondents. Without a
+secret the route is disabled.
+
+Command line:
+
+    python exporters.py csv|jsonl|parquet|arrow <form_id> <output file>
+"""
+import os
+import sys
+import csv
+import io
+import hmac
+import json
+import time
+import hashlib
+import tempfile
+from urllib.parse import quote, urlencode
+
+from form_logic import calculate_screening_status
+import storage
+from storage import iter_form_responses
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SECRET = os.environ.get('FORMS_EXPORT_SECRET', '')
+# Seconds a signed export link stays valid
+EXPORT_LINK_TTL = 15 * 60
+
+
+def csv_header(form):
+    """Column names of the responses CSV (same layout as the original pandas export)"""
+    header = ['Response ID', 'Submitted At']
+    if form['settings'].get('enable_screening', False):
+        header.append('Screening Status')
+    header.extend(f"Q{i+1}: {question['text'][:50]}" for i, question in enumerate(form['questions']))
+    return header
+
+
+def csv_row(form, response):
+    row = [response['id'], response['submitted_at']]
+
+    # Add screening status if enabled
+    if form['settings'].get('enable_screening', False):
+        row.append(calculate_screening_status(response['answers'], len(form['questions'])))
+
+    # Add answers
+    for question in form['questions']:
+        answer = response['answers'].get(question['id'], '')
+        if isinstance(answer, list):
+            answer = ', '.join(answer)
+        row.append(answer)
+    return row
+
+
+def iter_csv_chunks(form, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the responses CSV as text chunks of at most batch_size rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(csv_header(form))
+
+    rows = 0
+    for response in iter_form_responses(form['id'], batch_size=batch_size):
+        writer.writerow(csv_row(form, response))
+        rows += 1
+        if rows % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_responses_csv(form, fileobj, batch_size=EXPORT_BATCH_SIZE):
+    """Write the responses CSV to a text file object and return the number of chunks"""
+    chunks = 0
+    for chunk in iter_csv_chunks(form, batch_size=batch_size):
+        fileobj.write(chunk)
+        chunks += 1
+    return chunks
+
+
+def export_responses_csv(form, batch_size=EXPORT_BATCH_SIZE):
+    """Stream the responses CSV into a temporary file, returned open for binary reading
+
+    The file is deleted when it is closed.
+    """
+    return export_responses(form, 'csv', batch_size=batch_size)
+
+
+# Typed (columnar) exports
+NUMERIC_EXPORT_TYPES = {'number', 'scale'}
+LIST_EXPORT_TYPES = {'checkboxes'}
+GRID_EXPORT_TYPES = {'grid', 'multiple-grids'}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _column_kind(question):
+    if question['type'] in NUMERIC_EXPORT_TYPES:
+        return 'float'
+    if question['type'] in LIST_EXPORT_TYPES:
+        return 'list'
+    if question['type'] in GRID_EXPORT_TYPES and question.get('rows'):
+        return 'struct'
+    return 'string'
+
+
+def _typed_value(kind, answer, question):
+    """Answer converted to its column type, or None when missing/not convertible"""
+    if answer is None:
+        return None
+    if kind == 'float':
+        if isinstance(answer, bool) or answer == '':
+            return None
+        try:
+            return float(answer)
+        except (TypeError, ValueError):
+            return None
+    if kind == 'list':
+        if isinstance(answer, list):
+            return [str(a) for a in answer]
+        return [str(answer)] if answer else []
+    if kind == 'struct':
+        if not isinstance(answer, dict):
+            return None
+        return {row: (None if answer.get(row) is None else str(answer.get(row))) for row in question['rows']}
+    if isinstance(answer, list):
+        return ', '.join(str(a) for a in answer)
+    if isinstance(answer, dict):
+        return json.dumps(answer)
+    return str(answer)
+
+
+def typed_columns(form):
+    """(column name, kind, question) for each question; names are q1, q2, ..."""
+    return [(f"q{i+1}", _column_kind(q), q) for i, q in enumerate(form['questions'])]
+
+
+def typed_record(form, columns, response):
+    """One response as a flat dict of typed values"""
+    record = {
+        'response_id': response['id'],
+        'submitted_at': response['submitted_at'],
+        'form_version': response['form_version'],
+    }
+    if form['settings'].get('enable_screening', False):
+        record['screening_status'] = calculate_screening_status(response['answers'], len(form['questions']))
+    for name, kind, question in columns:
+        record[name] = _typed_value(kind, response['answers'].get(question['id']), question)
+    return record
+
+
+def arrow_schema(form):
+    pa = _require_pyarrow()
+    fields = [
+        pa.field('response_id', pa.string()),
+        pa.field('submitted_at', pa.string()),
+        pa.field('form_version', pa.string()),
+    ]
+    if form['settings'].get('enable_screening', False):
+        fields.append(pa.field('screening_status', pa.string()))
+
+    for name, kind, question in typed_columns(form):
+        if kind == 'float':
+            arrow_type = pa.float64()
+        elif kind == 'list':
+            arrow_type = pa.list_(pa.string())
+        elif kind == 'struct':
+            arrow_type = pa.struct([pa.field(row, pa.string()) for row in question['rows']])
+        else:
+            arrow_type = pa.string()
+        # Keep the question text with the column so downstream jobs can label it
+        fields.append(pa.field(name, arrow_type, metadata={'question': question['text'], 'question_id': question['id']}))
+    return pa.schema(fields, metadata={'form_id': form['id'], 'title': form['title']})
+
+
+def iter_record_batches(form, batch_size=EXPORT_BATCH_SIZE):
+    """Yield pyarrow RecordBatches of at most batch_size responses"""
+    pa = _require_pyarrow()
+    schema = arrow_schema(form)
+    columns = typed_columns(form)
+
+    records = []
+    for response in iter_form_responses(form['id'], batch_size=batch_size):
+        records.append(typed_record(form, columns, response))
+        if len(records) == batch_size:
+            yield pa.RecordBatch.from_pylist(records, schema=schema)
+            records = []
+
+    if records:
+        yield pa.RecordBatch.from_pylist(records, schema=schema)
+
+
+def write_responses_parquet(form, sink, batch_size=EXPORT_BATCH_SIZE):
+    """Write responses as Parquet, one row group per batch"""
+    _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(sink, arrow_schema(form)) as writer:
+        for batch in iter_record_batches(form, batch_size=batch_size):
+            writer.write_batch(batch)
+
+
+def write_responses_arrow(form, sink, batch_size=EXPORT_BATCH_SIZE):
+    """Write responses in the Arrow IPC file format"""
+    pa = _require_pyarrow()
+
+    with pa.ipc.new_file(sink, arrow_schema(form)) as writer:
+        for batch in iter_record_batches(form, batch_size=batch_size):
+            writer.write_batch(batch)
+
+
+def iter_jsonl_chunks(form, batch_size=EXPORT_BATCH_SIZE):
+    """Yield JSON Lines text (one typed record per response) in chunks"""
+    columns = typed_columns(form)
+    lines = []
+    for response in iter_form_responses(form['id'], batch_size=batch_size):
+        lines.append(json.dumps(typed_record(form, columns, response)) + '\n')
+        if len(lines) == batch_size:
+            yield ''.join(lines)
+            lines = []
+
+    if lines:
+        yield ''.join(lines)
+
+
+def write_responses_jsonl(form, fileobj, batch_size=EXPORT_BATCH_SIZE):
+    for chunk in iter_jsonl_chunks(form, batch_size=batch_size):
+        fileobj.write(chunk)
+
+
+EXPORT_FORMATS = {
+    'csv': ('text', write_responses_csv, 'text/csv'),
+    'jsonl': ('text', write_responses_jsonl, 'application/x-ndjson'),
+    'parquet': ('binary', write_responses_parquet, 'application/vnd.apache.parquet'),
+    'arrow': ('binary', write_responses_arrow, 'application/vnd.apache.arrow.file'),
+}
+
+
+# Formats the API can stream chunk by chunk: (chunk iterator, MIME type)
+STREAMING_FORMATS = {
+    'csv': (iter_csv_chunks, 'text/csv'),
+    'jsonl': (iter_jsonl_chunks, 'application/x-ndjson'),
+}
+
+
+def export_signature(form_id, export_format, expires, secret=None):
+    secret = EXPORT_SECRET if secret is None else secret
+    message = f"{form_id}\n{export_format}\n{expires}".encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def export_link(base_url, form_id, export_format, ttl=EXPORT_LINK_TTL):
+    """Signed URL of the API's streaming export, or None if links aren't configured"""
+    if not base_url or not EXPORT_SECRET or export_format not in STREAMING_FORMATS:
+        return None
+    expires = int(time.time()) + ttl
+    query = urlencode({'expires': expires, 'signature': export_signature(form_id, export_format, expires)})
+    return f"{base_url.rstrip('/')}/forms/{quote(form_id, safe='')}/export.{export_format}?{query}"
+
+
+def check_export_link(form_id, export_format, expires, signature):
+    """Whether an export link's signature is valid and it hasn't expired"""
+    if not EXPORT_SECRET:
+        return False
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(export_signature(form_id, export_format, expires), signature or '')
+
+
+def export_responses(form, export_format, batch_size=EXPORT_BATCH_SIZE):
+    """Export responses in any supported format to a temporary file opened for binary reading"""
+    mode, writer, _ = EXPORT_FORMATS[export_format]
+    spool = tempfile.TemporaryFile()
+    if mode == 'text':
+        text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+        writer(form, text, batch_size=batch_size)
+        text.flush()
+        text.detach()
+    else:
+        writer(form, spool, batch_size=batch_size)
+    spool.seek(0)
+    return spool
+
+
+def main(argv):
+    if len(argv) != 4 or argv[1] not in EXPORT_FORMATS:
+        print(__doc__.strip())
+        return 1
+
+    export_format, form_id, output = argv[1:]
+    storage.init_database()
+    form = storage.load_form(form_id)
+    if form is None:
+        print(f"Form not found: {form_id}")
+        return 1
+
+    mode, writer, _ = EXPORT_FORMATS[export_format]
+    if mode == 'text':
+        with open(output, 'w', encoding='utf-8', newline='') as fileobj:
+            writer(form, fileobj)
+    else:
+        with open(output, 'wb') as fileobj:
+            writer(form, fileobj)
+    print(f"Exported {form_id} to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
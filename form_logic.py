@@ -0,0 +1,397 @@
+"""Skip logic, option rules and screening helpers
+
+check_skip_logic and friends evaluate one rule at a time. CompiledForm
+precomputes a form's rules once (option rules by source question, the
+skip-logic jump tables, section starts), so the filler, the API and
+validation answer visibility questions without rescanning every question;
+get_compiled_logic caches it per form.
+"""
+from bisect import bisect_left
+
+from cache import FormCache, form_cache_key
+
+# Question types grouped the way check_skip_logic branches on them
+CHOICE_SKIP_TYPES = {'multiple-choice', 'dropdown', 'likert'}
+TEXT_SKIP_TYPES = {'short-text', 'paragraph', 'email'}
+NUMERIC_SKIP_TYPES = {'number', 'scale'}
+
+# Filler layouts: every visible question on one page, or a paged wizard
+PAGE_LAYOUTS = {
+    'all': "All questions on one page",
+    'question': "One question per page",
+    'section': "One section per page",
+}
+
+
+def calculate_screening_status(answers, total_questions):
+    answered = len([a for a in answers.values() if a])
+    percentage = answered / total_questions if total_questions > 0 else 0
+    
+    if percentage == 1.0:
+        return "Passed"
+    elif percentage > 0.5:
+        return "Pending"
+    else:
+        return "Failed"
+
+
+def check_skip_logic(question, answer, all_questions):
+    """Check if skip logic should be applied based on the answer"""
+    if 'skipLogic' not in question or not question['skipLogic']:
+        return None
+    
+    for rule in question['skipLogic']:
+        should_skip = False
+        
+        if question['type'] in ['multiple-choice', 'dropdown', 'likert']:
+            should_skip = answer == rule.get('option')
+        elif question['type'] == 'checkbox':
+            should_skip = isinstance(answer, list) and rule.get('option') in answer
+        elif question['type'] in ['short-text', 'paragraph', 'email']:
+            should_skip = answer == rule.get('value')
+        elif question['type'] in ['number', 'scale']:
+            operator = rule.get('operator', 'equals')
+            value = rule.get('value')
+            if operator == 'equals':
+                should_skip = answer == value
+            elif operator == 'greater':
+                should_skip = answer > value
+            elif operator == 'less':
+                should_skip = answer < value
+        
+        if should_skip:
+            return rule.get('target')
+    
+    return None
+
+
+def should_hide_option(question, option_value, all_answers, all_questions):
+    """Check if an option should be hidden based on option rules"""
+    if 'optionRules' not in question or not question['optionRules']:
+        return False
+    
+    for rule in question['optionRules']:
+        source_question_idx = rule.get('sourceQuestion')
+        source_value = rule.get('sourceValue')
+        hidden_options = rule.get('hiddenOptions', [])
+        
+        # Debug information
+        # st.write(f"DEBUG - Rule: source_q={source_question_idx}, source_val={source_value}, hidden={hidden_options}")
+        # st.write(f"DEBUG - Checking option: {option_value}, answers: {all_answers}")
+        
+        if (source_question_idx is not None and 
+            source_value and 
+            option_value in hidden_options):
+            
+            # Get the answer from the source question
+            source_answer = all_answers.get(source_question_idx)
+            
+            # Handle different answer types
+            if isinstance(source_answer, list):
+                # For checkbox answers
+                if source_value in source_answer:
+                    return True
+            elif isinstance(source_answer, str):
+                # For text/dropdown/radio answers
+                if source_answer == source_value:
+                    return True
+            elif source_answer is not None:
+                # For numeric answers, convert to string for comparison
+                if str(source_answer) == str(source_value):
+                    return True
+    
+    return False
+
+
+# Compiled skip logic
+class CompiledSkipLogic:
+    """Skip rules of a form compiled into per-question jump tables
+
+    Built once per form version. For choice and text questions each rule
+    becomes an answer -> target dict entry (first matching rule wins, as in
+    check_skip_logic); checkbox rules map option -> rule position so a list
+    answer resolves in O(len(answer)); numeric rules stay an ordered list of
+    comparisons.
+    """
+
+    def __init__(self, questions):
+        self.num_questions = len(questions)
+        self._resolvers = [self._compile_question(q) for q in questions]
+
+    @staticmethod
+    def _compile_question(question):
+        rules = question.get('skipLogic')
+        if not rules:
+            return None
+
+        q_type = question['type']
+        if q_type in CHOICE_SKIP_TYPES or q_type in TEXT_SKIP_TYPES:
+            key = 'option' if q_type in CHOICE_SKIP_TYPES else 'value'
+            table = {}
+            for rule in rules:
+                try:
+                    table.setdefault(rule.get(key), rule.get('target'))
+                except TypeError:
+                    continue
+            return ('table', table)
+
+        if q_type == 'checkbox':
+            positions = {}
+            targets = []
+            for position, rule in enumerate(rules):
+                try:
+                    positions.setdefault(rule.get('option'), position)
+                except TypeError:
+                    pass
+                targets.append(rule.get('target'))
+            return ('checkbox', (positions, targets))
+
+        if q_type in NUMERIC_SKIP_TYPES:
+            comparisons = [
+                (rule.get('operator', 'equals'), rule.get('value'), rule.get('target'))
+                for rule in rules
+            ]
+            return ('numeric', comparisons)
+
+        return None
+
+    def target(self, question_idx, answer):
+        """Skip target for an answer, equivalent to check_skip_logic"""
+        resolver = self._resolvers[question_idx]
+        if resolver is None:
+            return None
+
+        kind, data = resolver
+        if kind == 'table':
+            try:
+                return data.get(answer)
+            except TypeError:
+                return None
+
+        if kind == 'checkbox':
+            if not isinstance(answer, list):
+                return None
+            positions, targets = data
+            best = None
+            for value in answer:
+                try:
+                    position = positions.get(value)
+                except TypeError:
+                    continue
+                if position is not None and (best is None or position < best):
+                    best = position
+            return targets[best] if best is not None else None
+
+        for operator, value, target in data:
+            try:
+                if operator == 'equals':
+                    matched = answer == value
+                elif operator == 'greater':
+                    matched = answer > value
+                elif operator == 'less':
+                    matched = answer < value
+                else:
+                    matched = False
+            except TypeError:
+                matched = False
+            if matched:
+                return target
+        return None
+
+    def next_question(self, question_idx, answers):
+        """Index of the question shown after question_idx, or None at the end of the form"""
+        next_idx = question_idx + 1
+        if question_idx in answers:
+            skip_target = self.target(question_idx, answers[question_idx])
+            if skip_target == "end":
+                return None
+            elif skip_target is not None and skip_target > question_idx:
+                next_idx = skip_target
+
+        return next_idx if next_idx < self.num_questions else None
+
+    def _walk(self, answers, visible, current_idx):
+        while current_idx is not None and current_idx < self.num_questions:
+            visible.append(current_idx)
+            current_idx = self.next_question(current_idx, answers)
+        return visible
+
+    def visible_questions(self, answers):
+        """Indices of the questions shown for the given answers"""
+        return self._walk(answers, [], 0)
+
+    def update_visible_questions(self, visible, answers, changed):
+        """Recompute visible question indices after the answers in changed were edited
+
+        The walk only reads answers of questions it visits, so edits to hidden
+        questions leave the result unchanged, and otherwise the walk resumes
+        from the earliest edited visible question instead of question 0.
+        """
+        resume_at = None
+        for question_idx in changed:
+            position = bisect_left(visible, question_idx)
+            if position < len(visible) and visible[position] == question_idx:
+                if resume_at is None or position < resume_at:
+                    resume_at = position
+
+        if resume_at is None:
+            return visible
+        return self._walk(answers, visible[:resume_at], visible[resume_at])
+
+
+# Compiled option rules
+def _source_matches(source_answer, source_value):
+    """Whether a source question's answer triggers an option rule (see should_hide_option)"""
+    if isinstance(source_answer, list):
+        return source_value in source_answer
+    elif isinstance(source_answer, str):
+        return source_answer == source_value
+    elif source_answer is not None:
+        return str(source_answer) == str(source_value)
+    return False
+
+
+class CompiledOptionRules:
+    """Option hiding rules of a form indexed by source question
+
+    The reverse index maps source question -> [(affected question, trigger
+    value, hidden options)], so the hidden options of every question are
+    computed in one pass over the rules, and after an edit only the
+    questions that depend on the edited answers are recomputed.
+    """
+
+    def __init__(self, questions):
+        self.by_source = {}
+        self.dependents = {}
+        for target_idx, question in enumerate(questions):
+            for rule in question.get('optionRules') or []:
+                source_idx = rule.get('sourceQuestion')
+                source_value = rule.get('sourceValue')
+                hidden_options = rule.get('hiddenOptions', [])
+                # Same validity checks as should_hide_option
+                if source_idx is None or not source_value or not hidden_options:
+                    continue
+                self.by_source.setdefault(source_idx, []).append(
+                    (target_idx, source_value, frozenset(hidden_options))
+                )
+                self.dependents.setdefault(source_idx, set()).add(target_idx)
+
+    def _apply(self, hidden, answers, sources, targets=None):
+        for source_idx in sources:
+            source_answer = answers.get(source_idx)
+            if source_answer is None:
+                continue
+            for target_idx, source_value, hidden_options in self.by_source[source_idx]:
+                if targets is not None and target_idx not in targets:
+                    continue
+                if _source_matches(source_answer, source_value):
+                    hidden.setdefault(target_idx, set()).update(hidden_options)
+        return hidden
+
+    def hidden_options(self, answers):
+        """Map question index -> set of options hidden for the given answers"""
+        return self._apply({}, answers, self.by_source)
+
+    def update_hidden_options(self, hidden, answers, changed):
+        """Recompute hidden options only for questions depending on the changed answers"""
+        targets = set()
+        for source_idx in changed:
+            targets.update(self.dependents.get(source_idx, ()))
+        if not targets:
+            return hidden
+
+        updated = {idx: options for idx, options in hidden.items() if idx not in targets}
+        sources = {
+            source_idx for source_idx, dependents in self.dependents.items()
+            if not dependents.isdisjoint(targets)
+        }
+        return self._apply(updated, answers, sources, targets)
+
+    def drop_hidden_answers(self, answers, hidden, targets=None):
+        """Remove selections of hidden options from answers, in place
+
+        A single answer that is now hidden is deleted; hidden options are
+        taken out of checkbox lists. Dropping an answer can hide or show
+        options of the questions depending on it, so this repeats for them.
+        Only targets are checked at first (default: every question with
+        hidden options). Returns (updated hidden options, indexes of the
+        answers that changed).
+        """
+        changed = set()
+        pending = set(hidden) if targets is None else set(targets)
+        while pending:
+            dropped = set()
+            for question_idx in pending:
+                options = hidden.get(question_idx)
+                if not options or question_idx not in answers:
+                    continue
+                answer = answers[question_idx]
+                if isinstance(answer, list):
+                    kept = [a for a in answer if not (isinstance(a, str) and a in options)]
+                    if len(kept) != len(answer):
+                        answers[question_idx] = kept
+                        dropped.add(question_idx)
+                elif isinstance(answer, str) and answer in options:
+                    del answers[question_idx]
+                    dropped.add(question_idx)
+            if not dropped:
+                break
+            changed |= dropped
+            hidden = self.update_hidden_options(hidden, answers, dropped)
+            pending = set()
+            for question_idx in dropped:
+                pending.update(self.dependents.get(question_idx, ()))
+        return hidden, changed
+
+
+class CompiledForm:
+    """Compiled skip logic and option rules for one form version"""
+
+    def __init__(self, questions):
+        self.skip_logic = CompiledSkipLogic(questions)
+        self.option_rules = CompiledOptionRules(questions)
+        # Questions marked as the first of a new section (page) in the wizard
+        self.section_starts = frozenset(
+            i for i, question in enumerate(questions) if question.get('pageBreak')
+        )
+
+    def page(self, start_idx, answers, layout):
+        """Question indexes of the wizard page that starts at start_idx
+
+        With the 'question' layout every page holds one question; with
+        'section' it runs along the skip logic until the next question that
+        starts a section. Only the questions on the page are walked.
+        """
+        page = [start_idx]
+        if layout == 'section':
+            next_idx = self.skip_logic.next_question(start_idx, answers)
+            while next_idx is not None and next_idx not in self.section_starts:
+                page.append(next_idx)
+                next_idx = self.skip_logic.next_question(next_idx, answers)
+        return page
+
+    def next_page_start(self, page, answers):
+        """First question of the page after page, or None if page is the last one"""
+        return self.skip_logic.next_question(page[-1], answers)
+
+    def page_count(self, visible, layout):
+        """Number of wizard pages for the visible question indexes"""
+        if layout != 'section' or not visible:
+            return len(visible)
+        return 1 + sum(1 for idx in visible[1:] if idx in self.section_starts)
+
+
+_compiled_cache = FormCache()
+
+
+def get_compiled_logic(form):
+    """Compiled rules for a form, cached per form version (see cache.form_cache_key)"""
+    cache_key = form_cache_key(form)
+    if cache_key is None:
+        return CompiledForm(form['questions'])
+
+    compiled = _compiled_cache.get(*cache_key)
+    if compiled is None:
+        compiled = CompiledForm(form['questions'])
+        _compiled_cache.put(*cache_key, compiled)
+    return compiled
@@ -0,0 +1,210 @@
+"""Bulk response imports from CSV and JSON Lines
+
+Files are read in chunks, each chunk is validated against the form with its
+compiled validator and inserted with storage.save_responses_bulk (one
+executemany per transaction), so memory stays bounded by the chunk size.
+
+Accepted input:
+
+    CSV    the responses CSV from exporters.py ("Response ID", "Submitted At",
+           "Q1: ...", "Q2: ..."); checkbox answers are ", "-separated and
+           empty cells are treated as unanswered
+    JSONL  typed records from exporters.py (response_id, submitted_at, form_version,
+           q1, q2, ...) or stored-response records ({"id", "submitted_at", "answers": {...}})
+
+Command line:
+
+    python importers.py <form_id> <input.csv|input.jsonl> [chunk size]
+"""
+import sys
+import ast
+import csv
+import json
+import math
+import re
+import uuid
+from datetime import datetime
+
+import storage
+from validation import get_validator
+
+IMPORT_CHUNK_SIZE = 10000
+CSV_QUESTION_COLUMN = re.compile(r'^Q(\d+):')
+JSONL_QUESTION_FIELD = re.compile(r'^q(\d+)$')
+
+
+def _csv_answer(question, value):
+    """Answer parsed back from its exported CSV cell, or None when empty"""
+    if value == '':
+        return None
+    q_type = question['type']
+    if q_type == 'checkboxes':
+        return value.split(', ')
+    if q_type == 'number':
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        # Leave inf/nan as text so validation rejects them
+        return number if math.isfinite(number) else value
+    if q_type == 'scale':
+        try:
+            return int(float(value))
+        except (ValueError, OverflowError):
+            return value
+    if value.startswith('{') and question.get('rows'):
+        # Grid answers are exported as the dict's repr
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    return value
+
+
+def iter_csv_records(form, fileobj):
+    """Yield response records from an exported responses CSV"""
+    reader = csv.reader(fileobj)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    columns = {}
+    for position, name in enumerate(header):
+        if name == 'Response ID':
+            columns['id'] = position
+        elif name == 'Submitted At':
+            columns['submitted_at'] = position
+        else:
+            match = CSV_QUESTION_COLUMN.match(name)
+            if match:
+                question_idx = int(match.group(1)) - 1
+                if not 0 <= question_idx < len(form['questions']):
+                    raise ValueError(f"Column {name!r} does not match a question of this form")
+                columns[question_idx] = position
+
+    question_columns = [(k, v) for k, v in columns.items() if isinstance(k, int)]
+    for row in reader:
+        if not row:
+            continue
+        answers = {}
+        for question_idx, position in question_columns:
+            question = form['questions'][question_idx]
+            answer = _csv_answer(question, row[position] if position < len(row) else '')
+            if answer is not None:
+                answers[question['id']] = answer
+        yield {
+            'id': row[columns['id']] if 'id' in columns else None,
+            'submitted_at': row[columns['submitted_at']] if 'submitted_at' in columns else None,
+            'answers': answers,
+        }
+
+
+def iter_jsonl_records(form, fileobj):
+    """Yield response records from JSON Lines (typed export or stored-response records)"""
+    for line_number, line in enumerate(fileobj, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_number} is not valid JSON")
+
+        if isinstance(data.get('answers'), dict):
+            answers = {str(k): v for k, v in data['answers'].items()}
+        else:
+            # Typed columns follow the form's current question order
+            answers = {}
+            for field, value in data.items():
+                match = JSONL_QUESTION_FIELD.match(field)
+                if match and value is not None:
+                    question_idx = int(match.group(1)) - 1
+                    if not 0 <= question_idx < len(form['questions']):
+                        raise ValueError(f"Field {field!r} does not match a question of this form")
+                    answers[form['questions'][question_idx]['id']] = value
+        yield {
+            'id': data.get('id') or data.get('response_id'),
+            'submitted_at': data.get('submitted_at'),
+            'form_version': data.get('form_version'),
+            'answers': answers,
+        }
+
+
+IMPORT_FORMATS = {
+    'csv': iter_csv_records,
+    'jsonl': iter_jsonl_records,
+}
+
+
+def import_responses(form, fileobj, import_format, chunk_size=IMPORT_CHUNK_SIZE, max_errors=20):
+    """Validate and insert responses from a text file object
+
+    Invalid rows are skipped. Returns a dict with read, inserted and
+    invalid counts, plus up to max_errors (row number, errors) examples.
+    """
+    validator = get_validator(form)
+    result = {'read': 0, 'inserted': 0, 'invalid': 0, 'errors': []}
+
+    def flush(chunk):
+        invalid = validator.validate_batch(record['answers'] for record in chunk)
+        for position, errors in invalid:
+            if len(result['errors']) < max_errors:
+                result['errors'].append((result['read'] - len(chunk) + position + 1, errors))
+        result['invalid'] += len(invalid)
+
+        invalid_positions = {position for position, _ in invalid}
+        valid = [record for position, record in enumerate(chunk) if position not in invalid_positions]
+        for record in valid:
+            # Validation ignored selections of hidden options; don't store them either
+            record['answers'] = validator.normalize(record['answers'])
+        if valid:
+            result['inserted'] += storage.save_responses_bulk(form, valid)
+
+    now = str(datetime.now())
+    chunk = []
+    for record in IMPORT_FORMATS[import_format](form, fileobj):
+        record['id'] = record['id'] or str(uuid.uuid4())
+        record['submitted_at'] = record['submitted_at'] or now
+        chunk.append(record)
+        result['read'] += 1
+        if len(chunk) == chunk_size:
+            flush(chunk)
+            chunk = []
+
+    if chunk:
+        flush(chunk)
+    return result
+
+
+def main(argv):
+    if len(argv) not in (3, 4) or not argv[2].endswith(('.csv', '.jsonl')):
+        print(__doc__.strip())
+        return 1
+
+    form_id, path = argv[1], argv[2]
+    chunk_size = int(argv[3]) if len(argv) == 4 else IMPORT_CHUNK_SIZE
+    import_format = 'csv' if path.endswith('.csv') else 'jsonl'
+
+    storage.init_database()
+    form = storage.load_form(form_id)
+    if form is None:
+        print(f"Form not found: {form_id}")
+        return 1
+
+    with open(path, encoding='utf-8', newline='') as fileobj:
+        try:
+            result = import_responses(form, fileobj, import_format, chunk_size=chunk_size)
+        except ValueError as e:
+            print(f"Import failed: {e}")
+            return 1
+
+    for row_number, errors in result['errors']:
+        details = '; '.join(f"Q{idx + 1 if isinstance(idx, int) else idx}: {message}"
+                            for idx, message in errors.items())
+        print(f"Row {row_number} skipped: {details}")
+    print(f"Read {result['read']} response(s): {result['inserted']} imported, "
+          f"{result['invalid']} invalid, {result['read'] - result['inserted'] - result['invalid']} already present")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
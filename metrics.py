@@ -0,0 +1,198 @@
+"""Timing instrumentation for hot paths, exported as Prometheus text
+
+Operations are timed with the instrument() decorator (storage helpers), the
+timed() context manager or observe(), and land in one histogram per
+operation (and labels). Rendered in the Prometheus text format, they are
+served by the JSON API at GET /metrics. With FORMS_METRICS_FILE set they
+are also written to that file every FORMS_METRICS_INTERVAL seconds, e.g.
+for node_exporter's textfile collector. "{pid}" in the path is replaced by
+the process id, so several app processes don't overwrite each other.
+
+Streamlit reruns are wrapped in rerun(), which records the total time and
+the time per operation inside it; the app's Performance panel shows the
+last few of these per session.
+"""
+import os
+import time
+import atexit
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_FILE = os.environ.get('FORMS_METRICS_FILE', '')
+METRICS_INTERVAL = float(os.environ.get('FORMS_METRICS_INTERVAL', '15'))
+
+METRIC_NAME = 'forms_operation_duration_seconds'
+# Upper bounds in seconds; hot-path operations take microseconds, reruns up to seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations (guarded by the registry lock)"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        position = bisect_left(BUCKETS, seconds)
+        if position < len(BUCKETS):
+            self.bucket_counts[position] += 1
+        self.count += 1
+        self.total += seconds
+
+
+_histograms = {}
+_lock = threading.Lock()
+# The rerun being recorded on this thread (Streamlit runs each session's script in its own thread)
+_local = threading.local()
+
+
+def observe(name, seconds, **labels):
+    """Record one duration for operation name"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    record = getattr(_local, 'rerun', None)
+    if record is not None:
+        span = record['spans'].setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+
+@contextmanager
+def timed(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def instrument(name):
+    """Decorator timing every call of a function as operation name"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def rerun(mode):
+    """Record a script rerun: yields a dict filled in with total and per-operation times
+
+    Call tag_rerun(form_id) inside to attribute the rerun to a form. Nested
+    calls (e.g. a fragment rerun inside a full one) record into the outer rerun.
+    """
+    if getattr(_local, 'rerun', None) is not None:
+        yield _local.rerun
+        return
+
+    record = {'mode': mode, 'form_id': None, 'started_at': time.time(), 'total': 0.0, 'spans': {}}
+    _local.rerun = record
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _local.rerun = None
+        record['total'] = time.perf_counter() - started
+        observe('app.rerun', record['total'], mode=mode, form_id=record['form_id'] or '')
+
+
+def tag_rerun(form_id):
+    record = getattr(_local, 'rerun', None)
+    if record is not None:
+        record['form_id'] = form_id
+
+
+def current_rerun():
+    """The rerun being recorded on this thread, or None"""
+    return getattr(_local, 'rerun', None)
+
+
+def snapshot():
+    """{(name, labels): (count, total seconds)} for every operation observed so far"""
+    with _lock:
+        return {key: (histogram.count, histogram.total) for key, histogram in _histograms.items()}
+
+
+def _label_text(name, labels, extra=()):
+    pairs = [('op', name)] + list(labels) + list(extra)
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format"""
+    with _lock:
+        entries = [
+            (name, labels, list(histogram.bucket_counts), histogram.count, histogram.total)
+            for (name, labels), histogram in sorted(_histograms.items())
+        ]
+
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in instrumented operations.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for name, labels, bucket_counts, count, total in entries:
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f"{METRIC_NAME}_bucket{_label_text(name, labels, [('le', repr(bound))])} {cumulative}")
+        lines.append(f"{METRIC_NAME}_bucket{_label_text(name, labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{METRIC_NAME}_sum{_label_text(name, labels)} {total!r}")
+        lines.append(f"{METRIC_NAME}_count{_label_text(name, labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics_file(path):
+    """Write the metrics atomically, so a scraper never reads a half-written file"""
+    path = path.replace('{pid}', str(os.getpid()))
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(temporary, path)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_file_exporter(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    """Write the metrics file periodically from a daemon thread (no-op without a path)"""
+    global _exporter
+    if not path or _exporter is not None:
+        return
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+
+        def export():
+            try:
+                write_metrics_file(path)
+            except OSError:
+                pass
+
+        def run():
+            while True:
+                time.sleep(interval)
+                export()
+
+        _exporter = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+        _exporter.start()
+        atexit.register(export)
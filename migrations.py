@@ -0,0 +1,258 @@
+"""Schema migrations for forms.db
+
+Each migration is a function that receives an open connection inside a
+transaction. The applied version is tracked in the schema_version table so
+existing databases are upgraded in place the first time the app starts.
+"""
+import json
+import sqlite3
+
+from question_ids import ensure_question_ids, encode_answers
+
+
+def _create_base_tables(conn):
+    """Original forms/responses tables (no-op for databases created before versioning)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS forms (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            questions TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_published BOOLEAN DEFAULT FALSE,
+            settings TEXT
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            id TEXT PRIMARY KEY,
+            form_id TEXT NOT NULL,
+            answers TEXT NOT NULL,
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_agent TEXT,
+            ip_address TEXT,
+            FOREIGN KEY (form_id) REFERENCES forms (id)
+        )
+    ''')
+
+
+def _responses_cascade_and_index(conn):
+    """Rebuild responses with ON DELETE CASCADE and a (form_id, submitted_at) index"""
+    # SQLite cannot alter a foreign key in place, so copy into a new table
+    conn.execute('''
+        CREATE TABLE responses_new (
+            id TEXT PRIMARY KEY,
+            form_id TEXT NOT NULL,
+            answers TEXT NOT NULL,
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_agent TEXT,
+            ip_address TEXT,
+            FOREIGN KEY (form_id) REFERENCES forms (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO responses_new (id, form_id, answers, submitted_at, user_agent, ip_address)
+        SELECT id, form_id, answers, submitted_at, user_agent, ip_address FROM responses
+        WHERE form_id IN (SELECT id FROM forms)
+    ''')
+    conn.execute('DROP TABLE responses')
+    conn.execute('ALTER TABLE responses_new RENAME TO responses')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_responses_form_submitted
+        ON responses (form_id, submitted_at)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_forms_last_modified ON forms (last_modified)')
+
+
+def _materialized_stats(conn):
+    """Per-form aggregate tables maintained by save_response (see stats.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS form_stats (
+            form_id TEXT PRIMARY KEY REFERENCES forms (id) ON DELETE CASCADE,
+            questions_hash TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            key_total INTEGER NOT NULL DEFAULT 0,
+            complete INTEGER NOT NULL DEFAULT 0,
+            passed INTEGER NOT NULL DEFAULT 0,
+            pending INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_stats (
+            form_id TEXT NOT NULL REFERENCES forms (id) ON DELETE CASCADE,
+            question_key TEXT NOT NULL,
+            response_count INTEGER NOT NULL DEFAULT 0,
+            answered_count INTEGER NOT NULL DEFAULT 0,
+            num_count INTEGER NOT NULL DEFAULT 0,
+            num_sum REAL NOT NULL DEFAULT 0,
+            num_min REAL,
+            num_max REAL,
+            text_words INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (form_id, question_key)
+        ) WITHOUT ROWID
+    ''')
+    # value has no declared type so 'a', 1 and 1.5 keep their own types
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS option_stats (
+            form_id TEXT NOT NULL REFERENCES forms (id) ON DELETE CASCADE,
+            question_key TEXT NOT NULL,
+            value,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (form_id, question_key, value)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _response_answered_count(conn):
+    """Denormalized answered-question count and a keyset pagination index"""
+    conn.execute('ALTER TABLE responses ADD COLUMN answered_count INTEGER')
+    # Number of truthy answers per response, as calculate_screening_status counts them
+    conn.execute('''
+        UPDATE responses SET answered_count = (
+            SELECT COALESCE(SUM(
+                CASE j.type
+                    WHEN 'null' THEN 0
+                    WHEN 'false' THEN 0
+                    WHEN 'true' THEN 1
+                    WHEN 'integer' THEN j.value != 0
+                    WHEN 'real' THEN j.value != 0
+                    WHEN 'text' THEN j.value != ''
+                    WHEN 'array' THEN json_array_length(j.value) > 0
+                    ELSE j.value != '{}'
+                END
+            ), 0)
+            FROM json_each(responses.answers) j
+        )
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_responses_form_submitted')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_responses_form_submitted_id
+        ON responses (form_id, submitted_at, id)
+    ''')
+
+
+def _question_ids(conn):
+    """Stable question ids; re-key stored answers from question index to question id"""
+    forms = conn.execute('SELECT id, questions FROM forms').fetchall()
+    for form_id, questions_json in forms:
+        questions = json.loads(questions_json)
+        if ensure_question_ids(questions):
+            # last_modified is left alone so the forms list keeps its order
+            conn.execute('UPDATE forms SET questions = ? WHERE id = ?', (json.dumps(questions), form_id))
+
+        # Walk the form's responses in rowid batches to bound memory
+        last_rowid = 0
+        while True:
+            rows = conn.execute('''
+                SELECT rowid, answers FROM responses
+                WHERE form_id = ? AND rowid > ? ORDER BY rowid LIMIT 1000
+            ''', (form_id, last_rowid)).fetchall()
+            if not rows:
+                break
+            conn.executemany('UPDATE responses SET answers = ? WHERE rowid = ?', [
+                (json.dumps(encode_answers(questions, json.loads(answers))), rowid)
+                for rowid, answers in rows
+            ])
+            last_rowid = rows[-1][0]
+
+    # Stats are keyed by question id now; they are rebuilt on next read
+    conn.execute('DELETE FROM option_stats')
+    conn.execute('DELETE FROM question_stats')
+    conn.execute('DELETE FROM form_stats')
+
+
+def _form_versions(conn):
+    """Immutable published snapshots, and the version each response answered"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS form_versions (
+            form_id TEXT NOT NULL REFERENCES forms (id) ON DELETE CASCADE,
+            version_number INTEGER NOT NULL,
+            version_hash TEXT NOT NULL,
+            title TEXT NOT NULL,
+            questions TEXT NOT NULL,
+            settings TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (form_id, version_number)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_form_versions_hash
+        ON form_versions (form_id, version_hash)
+    ''')
+    # NULL for responses stored before versioning; published forms get their
+    # first snapshot the next time they are served
+    conn.execute('ALTER TABLE responses ADD COLUMN form_version TEXT')
+
+
+def _drafts(conn):
+    """Partially filled forms saved server-side under a resume token"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS drafts (
+            token TEXT PRIMARY KEY,
+            form_id TEXT NOT NULL REFERENCES forms (id) ON DELETE CASCADE,
+            form_version TEXT,
+            answers TEXT NOT NULL,
+            pages TEXT,
+            updated_at TIMESTAMP NOT NULL
+        )
+    ''')
+    # The expiry sweep deletes by age
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_drafts_updated ON drafts (updated_at)')
+
+
+def _drop_orphaned_responses(conn):
+    """Responses of deleted forms that the cascade rebuild used to copy over"""
+    conn.execute('DELETE FROM responses WHERE form_id NOT IN (SELECT id FROM forms)')
+
+
+# Ordered list of migrations; the schema version is the number applied
+MIGRATIONS = [
+    _create_base_tables,
+    _responses_cascade_and_index,
+    _materialized_stats,
+    _response_answered_count,
+    _question_ids,
+    _form_versions,
+    _drafts,
+    _drop_orphaned_responses,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Apply any pending migrations and return the resulting schema version"""
+    # Table rebuilds must run with foreign key enforcement off, and the pragma
+    # is ignored inside a transaction, so switch it before BEGIN
+    conn.execute('PRAGMA foreign_keys = OFF')
+    try:
+        # IMMEDIATE takes the write lock up front so concurrent starters
+        # wait here and then see the version the first one applied
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = get_schema_version(conn)
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(conn)
+                conn.execute('INSERT INTO schema_version (version) VALUES (?)', (number,))
+            if version < SCHEMA_VERSION:
+                # Enforcement was off, so make sure the rebuilt tables still satisfy it
+                violation = conn.execute('PRAGMA foreign_key_check').fetchone()
+                if violation is not None:
+                    raise sqlite3.IntegrityError(
+                        f"Migration left a row in {violation[0]} (rowid {violation[1]}) "
+                        f"without its {violation[2]} parent"
+                    )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return max(version, SCHEMA_VERSION)
+    finally:
+        conn.execute('PRAGMA foreign_keys = ON')
@@ -0,0 +1,141 @@
+"""Opt-in per-rerun profiling with cProfile and tracemalloc
+
+Off unless FORMS_PROFILE=1; when off, capture() does nothing and the
+?profile query parameter is ignored. When on, a rerun is profiled if the
+page URL has ?profile=1 or, otherwise, with probability
+FORMS_PROFILE_SAMPLE (default 0, i.e. only on request). Each capture writes
+three files to FORMS_PROFILE_DIR (default "profiles"):
+
+    <stamp>-<label>.pstats      cProfile stats (python -m pstats, snakeviz)
+    <stamp>-<label>.tracemalloc tracemalloc snapshot (tracemalloc.Snapshot.load)
+    <stamp>-<label>.txt         readable report: top functions and allocations
+
+Only the newest FORMS_PROFILE_KEEP (default 50) captures are kept. Captures are
+serialized: tracemalloc is process-wide, so a rerun that starts while
+another is being profiled runs unprofiled.
+"""
+import os
+import re
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+ENABLED = os.environ.get('FORMS_PROFILE', '') == '1'
+SAMPLE_RATE = float(os.environ.get('FORMS_PROFILE_SAMPLE', '0'))
+PROFILE_DIR = os.environ.get('FORMS_PROFILE_DIR', 'profiles')
+KEEP = int(os.environ.get('FORMS_PROFILE_KEEP', '50'))
+REPORT_FUNCTIONS = 40
+REPORT_ALLOCATIONS = 20
+TRACEMALLOC_FRAMES = 10
+CAPTURE_SUFFIXES = ('.pstats', '.tracemalloc', '.txt')
+
+_capture_lock = threading.Lock()
+
+
+def should_profile(requested=False):
+    """Whether to profile this rerun: explicitly requested or sampled"""
+    if not ENABLED:
+        return False
+    return requested or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+
+def _capture_label(mode):
+    """File-name-safe label from the app mode and, if tagged, the rerun's form id"""
+    rerun = metrics.current_rerun()
+    parts = [mode, rerun['form_id'] if rerun and rerun['form_id'] else '']
+    label = '-'.join(part for part in parts if part)
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', label).strip('-') or 'rerun'
+
+
+def _report(profiler, snapshot, label, elapsed):
+    import io
+    import pstats
+
+    out = io.StringIO()
+    out.write(f"Profile of {label}: {elapsed * 1000:.1f} ms wall time\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_FUNCTIONS)
+
+    out.write(f"Top {REPORT_ALLOCATIONS} allocation sites still alive at the end of the rerun:\n")
+    for stat in snapshot.statistics('lineno')[:REPORT_ALLOCATIONS]:
+        out.write(f"{stat}\n")
+    return out.getvalue()
+
+
+def _rotate(directory, keep):
+    """Delete all but the newest keep captures"""
+    stems = {}
+    for name in os.listdir(directory):
+        stem, suffix = os.path.splitext(name)
+        if suffix in CAPTURE_SUFFIXES:
+            path = os.path.join(directory, name)
+            stems[stem] = max(stems.get(stem, 0), os.path.getmtime(path))
+
+    for stem in sorted(stems, key=stems.get, reverse=True)[keep:]:
+        for suffix in CAPTURE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def capture(mode, enabled=True, directory=PROFILE_DIR, keep=KEEP):
+    """Profile the block with cProfile and tracemalloc and write a capture
+
+    Yields a dict that is filled in with the report and file paths when the
+    block exits (even through an exception, e.g. st.rerun()); yields None
+    when profiling is off or another capture is running.
+    """
+    if not enabled or not _capture_lock.acquire(blocking=False):
+        yield None
+        return
+    # Imported here so the disabled path doesn't load the profilers
+    import cProfile
+    import tracemalloc
+
+    record = {}
+    try:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield record
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+            label = _capture_label(mode)
+            os.makedirs(directory, exist_ok=True)
+            now = time.time()
+            stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}-{os.getpid()}"
+            stem = os.path.join(directory, f"{stamp}-{label}")
+            profiler.dump_stats(stem + '.pstats')
+            snapshot.dump(stem + '.tracemalloc')
+            report = _report(profiler, snapshot, label, elapsed)
+            with open(stem + '.txt', 'w', encoding='utf-8') as f:
+                f.write(report)
+            _rotate(directory, keep)
+            record.update({'label': label, 'elapsed': elapsed, 'report': report, 'path': stem})
+    finally:
+        _capture_lock.release()
+
+
+def recent_captures(directory=PROFILE_DIR, limit=10):
+    """Paths (without suffix) of the newest captures that have a report"""
+    if not os.path.isdir(directory):
+        return []
+    reports = [
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.txt')
+    ]
+    reports.sort(key=os.path.getmtime, reverse=True)
+    return [os.path.splitext(path)[0] for path in reports[:limit]]
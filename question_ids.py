@@ -0,0 +1,55 @@
+"""Stable question ids and the canonical answer encoding
+
+Every question carries an 'id' ("q_" plus 8 hex digits) that never changes
+when questions are inserted, reordered or deleted. Stored answers are keyed
+by question id; the Streamlit filler, skip logic and the JSON API keep
+working with question indexes and are converted at the storage boundary.
+"""
+import uuid
+
+# Question types by how their answers are summarized (see analytics and stats)
+CHOICE_TYPES = {'multiple-choice', 'dropdown', 'likert-scale'}
+CHECKBOX_TYPES = {'checkboxes'}
+NUMERIC_TYPES = {'number', 'scale'}
+
+
+def new_question_id(existing=()):
+    while True:
+        question_id = f"q_{uuid.uuid4().hex[:8]}"
+        if question_id not in existing:
+            return question_id
+
+
+def ensure_question_ids(questions):
+    """Give every question without an id a new one (in place); True if any were added"""
+    existing = {q['id'] for q in questions if q.get('id')}
+    added = False
+    for question in questions:
+        if not question.get('id'):
+            question['id'] = new_question_id(existing)
+            existing.add(question['id'])
+            added = True
+    return added
+
+
+def question_index_by_id(questions):
+    return {question['id']: i for i, question in enumerate(questions) if question.get('id')}
+
+
+def encode_answers(questions, answers):
+    """Answers keyed by question id
+
+    Accepts keys that are already question ids, int indexes or numeric
+    strings (the index-keyed format used by the filler and older rows).
+    Keys that match no question are kept as they are.
+    """
+    num_questions = len(questions)
+    encoded = {}
+    for key, value in answers.items():
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            index = int(key)
+            if 0 <= index < num_questions and questions[index].get('id'):
+                key = questions[index]['id']
+        encoded[str(key)] = value
+    return encoded
+
@@ -0,0 +1,341 @@
+"""Materialized per-form response statistics
+
+save_response folds each new response into the form_stats, question_stats
+and option_stats tables inside its own transaction, so the dashboard reads
+O(questions) rows instead of scanning responses. Stats are tagged with the
+hash of the questions they were computed against; when a form's questions
+change they are rebuilt from the responses on the next read.
+
+Backfill or repair from the command line:
+
+    python stats.py rebuild            # every form
+    python stats.py rebuild <form_id>  # one form
+"""
+import sys
+import json
+
+import storage
+import analytics
+from metrics import instrument
+from question_ids import CHOICE_TYPES, CHECKBOX_TYPES, NUMERIC_TYPES
+
+# Rescans before giving up when responses are deleted while a rebuild reads them
+REBUILD_ATTEMPTS = 3
+
+SQL_RESPONSE_HIGH_WATER = 'SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM responses WHERE form_id = ?'
+
+SQL_BUMP_FORM_STATS = '''
+    UPDATE form_stats SET
+        total = total + ?,
+        key_total = key_total + ?,
+        complete = complete + ?,
+        passed = passed + ?,
+        pending = pending + ?
+    WHERE form_id = ? AND questions_hash = ?
+'''
+
+SQL_BUMP_QUESTION_STATS = '''
+    INSERT INTO question_stats
+    (form_id, question_key, response_count, answered_count, num_count, num_sum,
+     num_min, num_max, text_words)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (form_id, question_key) DO UPDATE SET
+        response_count = response_count + excluded.response_count,
+        answered_count = answered_count + excluded.answered_count,
+        num_count = num_count + excluded.num_count,
+        num_sum = num_sum + excluded.num_sum,
+        num_min = MIN(COALESCE(num_min, excluded.num_min), COALESCE(excluded.num_min, num_min)),
+        num_max = MAX(COALESCE(num_max, excluded.num_max), COALESCE(excluded.num_max, num_max)),
+        text_words = text_words + excluded.text_words
+'''
+
+SQL_BUMP_OPTION_STATS = '''
+    INSERT INTO option_stats (form_id, question_key, value, count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (form_id, question_key, value) DO UPDATE SET
+        count = count + excluded.count
+'''
+
+
+def _numeric_value(answer):
+    """Numeric value of an answer, or None if it isn't numeric (see analytics)"""
+    if isinstance(answer, bool):
+        return None
+    if isinstance(answer, (int, float)):
+        return float(answer)
+    if isinstance(answer, str):
+        try:
+            return float(answer)
+        except ValueError:
+            return None
+    return None
+
+
+def _word_count(answer):
+    if isinstance(answer, (list, dict)):
+        # Same text json_each hands to word_count() in analytics
+        answer = json.dumps(answer, separators=(',', ':'))
+    return len(str(answer).split())
+
+
+class StatsAccumulator:
+    """Stats deltas for a batch of responses to one form"""
+
+    def __init__(self, questions):
+        self.total_questions = len(questions)
+        self.kinds = {}
+        for question in questions:
+            if question['type'] in CHOICE_TYPES:
+                self.kinds[question['id']] = 'choice'
+            elif question['type'] in CHECKBOX_TYPES:
+                self.kinds[question['id']] = 'checkbox'
+            elif question['type'] in NUMERIC_TYPES:
+                self.kinds[question['id']] = 'numeric'
+            else:
+                self.kinds[question['id']] = 'text'
+
+        self.form_counts = [0, 0, 0, 0, 0]
+        self.questions = {}
+        self.options = {}
+
+    def _question(self, key):
+        entry = self.questions.get(key)
+        if entry is None:
+            # response_count, answered_count, num_count, num_sum, num_min, num_max, text_words
+            entry = self.questions[key] = [0, 0, 0, 0.0, None, None, 0]
+        return entry
+
+    def _count_option(self, key, value):
+        self.options[(key, value)] = self.options.get((key, value), 0) + 1
+
+    def add(self, answers):
+        """Fold one response's answers (keyed by question id) into the deltas"""
+        total = self.total_questions
+        truthy = len([a for a in answers.values() if a])
+
+        counts = self.form_counts
+        counts[0] += 1
+        counts[1] += len(answers)
+        counts[2] += len(answers) == total
+        counts[3] += truthy == total and total > 0
+        counts[4] += truthy != total and truthy * 2 > total
+
+        for key, answer in answers.items():
+            key = str(key)
+            entry = self._question(key)
+            entry[0] += 1
+            if not answer:
+                continue
+            entry[1] += 1
+
+            kind = self.kinds.get(key)
+            if kind == 'choice':
+                if not isinstance(answer, (list, dict)):
+                    self._count_option(key, answer)
+            elif kind == 'checkbox':
+                if isinstance(answer, list):
+                    for option in set(a for a in answer if not isinstance(a, (list, dict))):
+                        self._count_option(key, option)
+                elif not isinstance(answer, dict):
+                    self._count_option(key, answer)
+            elif kind == 'numeric':
+                number = _numeric_value(answer)
+                if number is not None:
+                    entry[2] += 1
+                    entry[3] += number
+                    entry[4] = number if entry[4] is None else min(entry[4], number)
+                    entry[5] = number if entry[5] is None else max(entry[5], number)
+                    self._count_option(key, number)
+            elif kind == 'text':
+                entry[6] += _word_count(answer)
+
+    def apply(self, conn, form_id, questions_hash):
+        """Add the deltas to the stats tables; False if the stats are stale or missing"""
+        cursor = conn.execute(SQL_BUMP_FORM_STATS, (*self.form_counts, form_id, questions_hash))
+        if cursor.rowcount == 0:
+            return False
+
+        conn.executemany(SQL_BUMP_QUESTION_STATS, [
+            (form_id, key, *entry) for key, entry in self.questions.items()
+        ])
+        conn.executemany(SQL_BUMP_OPTION_STATS, [
+            (form_id, key, value, count) for (key, value), count in self.options.items()
+        ])
+        return True
+
+
+def record_response(conn, form, answers):
+    """Fold a new response into the form's stats using the caller's transaction"""
+    accumulator = StatsAccumulator(form['questions'])
+    accumulator.add(answers)
+    return accumulator.apply(conn, form['id'], form['questions_hash'])
+
+
+@instrument('stats.rebuild_form_stats')
+def rebuild_form_stats(form_id):
+    """Recompute a form's stats from its stored responses
+
+    The responses are scanned in a read transaction, so submissions are
+    not blocked while they are decoded. Only the short write of the new
+    stats takes the write lock. Responses that landed in between (higher
+    rowids) are folded in then. If responses were deleted in between, the
+    scan is repeated. Returns False if the form doesn't exist or the scan
+    kept going stale.
+    """
+    form = storage.load_form(form_id)
+    if form is None:
+        return False
+
+    for _ in range(REBUILD_ATTEMPTS):
+        accumulator = StatsAccumulator(form['questions'])
+        with storage.get_pool().connection() as conn:
+            # One read snapshot (WAL) for the count, the high-water mark and the scan
+            conn.execute('BEGIN')
+            try:
+                count, max_rowid = conn.execute(SQL_RESPONSE_HIGH_WATER, (form_id,)).fetchone()
+                for answers, form_version in conn.execute(
+                    'SELECT answers, form_version FROM responses WHERE form_id = ? AND rowid <= ?',
+                    (form_id, max_rowid)
+                ):
+                    accumulator.add(storage.decode_stored_answers(form_id, form_version, answers))
+            finally:
+                conn.rollback()
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                new_rows = conn.execute(
+                    'SELECT answers, form_version FROM responses WHERE form_id = ? AND rowid > ?',
+                    (form_id, max_rowid)
+                ).fetchall()
+                current_count, _ = conn.execute(SQL_RESPONSE_HIGH_WATER, (form_id,)).fetchone()
+                if current_count != count + len(new_rows):
+                    # Responses were deleted since the scan
+                    conn.rollback()
+                    continue
+                for answers, form_version in new_rows:
+                    accumulator.add(storage.decode_stored_answers(form_id, form_version, answers))
+
+                conn.execute('DELETE FROM question_stats WHERE form_id = ?', (form_id,))
+                conn.execute('DELETE FROM option_stats WHERE form_id = ?', (form_id,))
+                conn.execute('''
+                    INSERT OR REPLACE INTO form_stats
+                    (form_id, questions_hash, total, key_total, complete, passed, pending)
+                    VALUES (?, ?, 0, 0, 0, 0, 0)
+                ''', (form_id, form['questions_hash']))
+                accumulator.apply(conn, form_id, form['questions_hash'])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return True
+    return False
+
+
+def rebuild_all_stats():
+    forms = storage.get_all_forms()
+    for form in forms:
+        rebuild_form_stats(form['id'])
+    return len(forms)
+
+
+def _read_summary(form):
+    """Summary from the stats tables, or None if they are missing or stale"""
+    form_id = form['id']
+    with storage.get_pool().connection() as conn:
+        row = conn.execute(
+            'SELECT questions_hash, total, key_total, complete, passed, pending FROM form_stats WHERE form_id = ?',
+            (form_id,)
+        ).fetchone()
+        if row is None or row[0] != form['questions_hash']:
+            return None
+
+        question_rows = {
+            r[0]: r[1:] for r in conn.execute('''
+                SELECT question_key, response_count, answered_count, num_count, num_sum,
+                       num_min, num_max, text_words
+                FROM question_stats WHERE form_id = ?
+            ''', (form_id,))
+        }
+        option_rows = {}
+        for key, value, count in conn.execute(
+            'SELECT question_key, value, count FROM option_stats WHERE form_id = ? ORDER BY question_key, value',
+            (form_id,)
+        ):
+            option_rows.setdefault(key, {})[value] = count
+
+    _, total, key_total, complete, passed, pending = row
+    summary = {
+        'form_id': form_id,
+        'total_questions': len(form['questions']),
+        'total_responses': total,
+        'complete': complete,
+        'passed': passed,
+        'pending': pending,
+        'failed': total - passed - pending,
+        'avg_answered': key_total / total if total else 0,
+        'questions': [],
+    }
+
+    for i, question in enumerate(form['questions']):
+        key = question['id']
+        (response_count, answered, num_count, num_sum,
+         num_min, num_max, text_words) = question_rows.get(key, (0, 0, 0, 0.0, None, None, 0))
+        entry = {'index': i, 'type': question['type'], 'response_count': response_count}
+
+        if question['type'] in CHOICE_TYPES or question['type'] in CHECKBOX_TYPES:
+            entry['option_counts'] = option_rows.get(key, {})
+        elif question['type'] in NUMERIC_TYPES:
+            entry['numeric'] = {
+                'count': num_count,
+                'mean': num_sum / num_count if num_count else None,
+                'min': num_min,
+                'max': num_max,
+                'distribution': option_rows.get(key, {}),
+            }
+        else:
+            entry['text'] = {
+                'answered': answered,
+                'avg_words': text_words / answered if answered else None,
+            }
+
+        summary['questions'].append(entry)
+
+    return summary
+
+
+@instrument('stats.get_form_summary')
+def get_form_summary(form):
+    """Form summary read from the materialized stats
+
+    Same structure as analytics.compute_form_summary. Stats that are missing
+    or were computed against different questions are rebuilt first.
+    """
+    summary = _read_summary(form)
+    if summary is None:
+        rebuild_form_stats(form['id'])
+        summary = _read_summary(form)
+    if summary is None:
+        # The form changed again while rebuilding; answer from the responses directly
+        summary = analytics.compute_form_summary(form)
+    return summary
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'rebuild':
+        print(__doc__.strip())
+        return 1
+
+    storage.init_database()
+    if len(argv) > 2:
+        for form_id in argv[2:]:
+            if not rebuild_form_stats(form_id):
+                print(f"Form not found: {form_id}")
+                return 1
+            print(f"Rebuilt stats for {form_id}")
+    else:
+        print(f"Rebuilt stats for {rebuild_all_stats()} form(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,779 @@
+import os
+import hashlib
+import sqlite3
+import json
+import time
+import uuid
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from cache import FormCache
+from migrations import migrate
+from question_ids import ensure_question_ids, encode_answers
+from answer_codec import pack_answers, unpack_answers
+from metrics import instrument
+import stats
+
+# Database location (override with FORMS_DB_PATH, e.g. for a throwaway test database)
+DB_PATH = os.environ.get('FORMS_DB_PATH', 'forms.db')
+
+# Pool tuning
+POOL_SIZE = int(os.environ.get('FORMS_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 30.0
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+# 'compact' stores answers to published versions in the binary format of answer_codec
+ANSWER_ENCODING = os.environ.get('FORMS_ANSWER_ENCODING', 'json')
+
+# Pragmas applied to every pooled connection
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 134217728',
+]
+
+# SQL statements are module constants so sqlite3's per-connection statement
+# cache reuses the prepared statement on every call from a pooled connection
+# save_form is an upsert rather than INSERT OR REPLACE: REPLACE deletes the
+# old row, which would cascade to the form's responses
+SQL_SAVE_FORM = '''
+    INSERT INTO forms
+    (id, title, questions, last_modified, is_published, settings)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        title = excluded.title,
+        questions = excluded.questions,
+        last_modified = excluded.last_modified,
+        is_published = excluded.is_published,
+        settings = excluded.settings
+'''
+SQL_LOAD_FORM = 'SELECT * FROM forms WHERE id = ?'
+SQL_FORM_LAST_MODIFIED = 'SELECT last_modified FROM forms WHERE id = ?'
+SQL_ALL_FORMS = 'SELECT id, title, created_at, is_published FROM forms ORDER BY last_modified DESC'
+SQL_SAVE_RESPONSE = '''
+    INSERT INTO responses
+    (id, form_id, answers, submitted_at, user_agent, ip_address, answered_count, form_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_SAVE_RESPONSE_IF_NEW = '''
+    INSERT OR IGNORE INTO responses
+    (id, form_id, answers, submitted_at, user_agent, ip_address, answered_count, form_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_FORM_RESPONSES = 'SELECT * FROM responses WHERE form_id = ? ORDER BY submitted_at DESC'
+SQL_RESPONSES_FIRST_PAGE = '''
+    SELECT * FROM responses WHERE form_id = ?
+    ORDER BY submitted_at DESC, id DESC LIMIT ?
+'''
+SQL_RESPONSES_NEXT_PAGE = '''
+    SELECT * FROM responses WHERE form_id = ? AND (submitted_at, id) < (?, ?)
+    ORDER BY submitted_at DESC, id DESC LIMIT ?
+'''
+# Screening status filters on the denormalized answered_count (see calculate_screening_status)
+SQL_STATUS_FILTERS = {
+    'Passed': 'answered_count = :total AND :total > 0',
+    'Pending': 'answered_count != :total AND answered_count * 2 > :total',
+    'Failed': 'NOT (answered_count = :total AND :total > 0) AND answered_count * 2 <= :total',
+}
+SQL_DELETE_FORM = 'DELETE FROM forms WHERE id = ?'
+# Published versions: immutable snapshots numbered per form
+SQL_LATEST_VERSION_HASH = '''
+    SELECT version_hash FROM form_versions WHERE form_id = ?
+    ORDER BY version_number DESC LIMIT 1
+'''
+SQL_LATEST_PUBLISHED_VERSION = '''
+    SELECT v.version_hash, v.version_number FROM form_versions v JOIN forms f ON f.id = v.form_id
+    WHERE v.form_id = ? AND f.is_published
+    ORDER BY v.version_number DESC LIMIT 1
+'''
+SQL_INSERT_VERSION = '''
+    INSERT INTO form_versions
+    (form_id, version_number, version_hash, title, questions, settings, created_at)
+    SELECT ?, COALESCE(MAX(version_number), 0) + 1, ?, ?, ?, ?, ?
+    FROM form_versions WHERE form_id = ?
+'''
+SQL_LOAD_VERSION = '''
+    SELECT version_number, version_hash, title, questions, settings, created_at
+    FROM form_versions WHERE form_id = ? AND version_hash = ?
+    ORDER BY version_number DESC LIMIT 1
+'''
+SQL_FORM_VERSIONS = '''
+    SELECT version_number, version_hash, created_at FROM form_versions
+    WHERE form_id = ? ORDER BY version_number DESC
+'''
+
+# Drafts: one row per resume token, rewritten in place
+SQL_SAVE_DRAFT = '''
+    INSERT INTO drafts (token, form_id, form_version, answers, pages, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (token) DO UPDATE SET
+        form_id = excluded.form_id,
+        form_version = excluded.form_version,
+        answers = excluded.answers,
+        pages = excluded.pages,
+        updated_at = excluded.updated_at
+'''
+SQL_LOAD_DRAFT = 'SELECT form_id, form_version, answers, pages, updated_at FROM drafts WHERE token = ?'
+SQL_DELETE_DRAFT = 'DELETE FROM drafts WHERE token = ?'
+SQL_DELETE_EXPIRED_DRAFTS = 'DELETE FROM drafts WHERE updated_at < ?'
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections configured for concurrent access"""
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        # Borrowers that found every connection in use, and how long they waited
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        started = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Timed out waiting for a connection to {self.path}")
+        finally:
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - started
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it goes back to the pool when the block exits"""
+        conn = self._acquire()
+        try:
+            yield conn
+        except sqlite3.IntegrityError:
+            self._release(conn)
+            raise
+        except sqlite3.DatabaseError:
+            # Don't hand a possibly broken connection to the next caller
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def close_all(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_form_cache = FormCache()
+# Snapshots never change, so entries are keyed by (form id, version hash)
+_version_cache = FormCache()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def set_database_path(path):
+    """Point the storage layer at another database file and reset the pool"""
+    global DB_PATH, _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        DB_PATH = path
+        _pool = None
+    _form_cache.clear()
+    _version_cache.clear()
+
+
+# Database setup
+@instrument('storage.init_database')
+def init_database():
+    """Create or upgrade the schema to the latest version"""
+    with get_pool().connection() as conn:
+        return migrate(conn)
+
+
+# Form and response helpers
+def form_version_hash(title, questions, settings):
+    """Content hash identifying a published version of a form"""
+    content = json.dumps([title, questions, settings], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+@contextmanager
+def _immediate(conn):
+    """Write transaction that takes the write lock at BEGIN
+
+    Publishing reads the latest version before inserting the next number;
+    with a deferred BEGIN two writers could both read it first.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _publish_version(conn, form_id, title, questions, settings):
+    """Snapshot the form unless its latest version already has this content
+
+    Call inside _immediate so the latest version can't change underneath.
+    """
+    version_hash = form_version_hash(title, questions, settings)
+    latest = conn.execute(SQL_LATEST_VERSION_HASH, (form_id,)).fetchone()
+    if latest is None or latest[0] != version_hash:
+        conn.execute(SQL_INSERT_VERSION, (
+            form_id, version_hash, title, json.dumps(questions), json.dumps(settings),
+            datetime.now(), form_id
+        ))
+    return version_hash
+
+
+@instrument('storage.save_form')
+def save_form(form_data):
+    """Save a form; saving a published form publishes a new version if its content changed"""
+    # New questions get their stable ids here (the caller's dict is updated too)
+    ensure_question_ids(form_data['questions'])
+    with get_pool().connection() as conn:
+        with _immediate(conn):
+            conn.execute(SQL_SAVE_FORM, (
+                form_data['id'],
+                form_data['title'],
+                json.dumps(form_data['questions']),
+                datetime.now(),
+                form_data.get('is_published', False),
+                json.dumps(form_data.get('settings', {}))
+            ))
+            if form_data.get('is_published', False):
+                _publish_version(conn, form_data['id'], form_data['title'],
+                                 form_data['questions'], form_data.get('settings', {}))
+    _form_cache.invalidate(form_data['id'])
+
+
+@instrument('storage.load_form')
+def load_form(form_id):
+    with get_pool().connection() as conn:
+        result = conn.execute(SQL_LOAD_FORM, (form_id,)).fetchone()
+
+    if result:
+        return {
+            'id': result[0],
+            'title': result[1],
+            'questions': json.loads(result[2]),
+            'questions_hash': hashlib.sha1(result[2].encode('utf-8')).hexdigest(),
+            'created_at': result[3],
+            'last_modified': result[4],
+            'is_published': bool(result[5]),
+            'settings': json.loads(result[6]) if result[6] else {}
+        }
+    return None
+
+
+@instrument('storage.get_form_definition')
+def get_form_definition(form_id):
+    """Cached, shared copy of a form for read-only use (filler, analytics)
+
+    Only last_modified is read from the database on a cache hit, so the
+    questions JSON is parsed once per form revision for all sessions. The
+    returned dict is shared: callers that edit a form must use load_form.
+    """
+    with get_pool().connection() as conn:
+        row = conn.execute(SQL_FORM_LAST_MODIFIED, (form_id,)).fetchone()
+
+    if row is None:
+        _form_cache.invalidate(form_id)
+        return None
+
+    form = _form_cache.get(form_id, row[0])
+    if form is None:
+        form = load_form(form_id)
+        if form is not None:
+            _form_cache.put(form_id, form['last_modified'], form)
+    return form
+
+
+@instrument('storage.get_form_version')
+def get_form_version(form_id, version_hash):
+    """Immutable snapshot of a published form version, or None
+
+    Shaped like get_form_definition's dict plus 'version' and
+    'version_number'; it is cached for the life of the process.
+    """
+    cache_key = (form_id, version_hash)
+    form = _version_cache.get(cache_key, version_hash)
+    if form is not None:
+        return form
+
+    with get_pool().connection() as conn:
+        row = conn.execute(SQL_LOAD_VERSION, (form_id, version_hash)).fetchone()
+    if row is None:
+        return None
+
+    version_number, version_hash, title, questions_json, settings_json, created_at = row
+    form = {
+        'id': form_id,
+        'title': title,
+        'questions': json.loads(questions_json),
+        'questions_hash': hashlib.sha1(questions_json.encode('utf-8')).hexdigest(),
+        'created_at': created_at,
+        'last_modified': created_at,
+        'is_published': True,
+        'settings': json.loads(settings_json) if settings_json else {},
+        'version': version_hash,
+        'version_number': version_number,
+    }
+    _version_cache.put(cache_key, version_hash, form)
+    return form
+
+
+@instrument('storage.get_published_form')
+def get_published_form(form_id):
+    """Latest published version of a form, or None if it isn't published"""
+    with get_pool().connection() as conn:
+        row = conn.execute(SQL_LATEST_PUBLISHED_VERSION, (form_id,)).fetchone()
+    if row is not None:
+        form = get_form_version(form_id, row[0])
+        if form is not None and form['version_number'] != row[1]:
+            # Content republished unchanged from an older version: same snapshot, newer number
+            form = dict(form, version_number=row[1])
+        return form
+
+    # Forms published before versioning get their first snapshot now
+    form = get_form_definition(form_id)
+    if form is None or not form['is_published']:
+        return None
+    with get_pool().connection() as conn:
+        with _immediate(conn):
+            version_hash = _publish_version(conn, form_id, form['title'], form['questions'], form['settings'])
+    return get_form_version(form_id, version_hash)
+
+
+@instrument('storage.get_form_versions')
+def get_form_versions(form_id):
+    """Published versions of a form, newest first"""
+    with get_pool().connection() as conn:
+        results = conn.execute(SQL_FORM_VERSIONS, (form_id,)).fetchall()
+
+    return [{'version_number': r[0], 'version': r[1], 'created_at': r[2]} for r in results]
+
+
+def _answer_questions(form, form_version):
+    """Questions that answers submitted against form_version are indexed by"""
+    if form_version:
+        version = get_form_version(form['id'], form_version)
+        if version is not None:
+            return version['questions']
+    return form['questions']
+
+
+def _stored_answers(form_id, form_version, answers):
+    """Column value for id-keyed answers: a compact BLOB when enabled and possible, else JSON"""
+    if ANSWER_ENCODING == 'compact' and form_version:
+        version = get_form_version(form_id, form_version)
+        if version is not None:
+            data = pack_answers(version['questions'], answers)
+            if data is not None:
+                return data
+    return json.dumps(answers)
+
+
+def decode_stored_answers(form_id, form_version, stored):
+    """Id-keyed answers from a responses.answers value in either encoding"""
+    if isinstance(stored, bytes):
+        return unpack_answers(get_form_version(form_id, form_version)['questions'], stored)
+    return json.loads(stored)
+
+
+@instrument('storage.get_all_forms')
+def get_all_forms():
+    with get_pool().connection() as conn:
+        results = conn.execute(SQL_ALL_FORMS).fetchall()
+
+    return [{'id': r[0], 'title': r[1], 'created_at': r[2], 'is_published': bool(r[3])} for r in results]
+
+
+@instrument('storage.save_response')
+def save_response(form_id, answers, form_version=None):
+    """Store a response; answers may be keyed by question index or question id
+
+    form_version is the hash of the published version that was answered;
+    question indexes are resolved against that version.
+    """
+    response_id = str(uuid.uuid4())
+    form = get_form_definition(form_id)
+    if form is not None:
+        answers = encode_answers(_answer_questions(form, form_version), answers)
+    stored = _stored_answers(form_id, form_version, answers)
+    with get_pool().connection() as conn:
+        with conn:
+            conn.execute(SQL_SAVE_RESPONSE, (
+                response_id,
+                form_id,
+                stored,
+                datetime.now(),
+                "Streamlit App",
+                "localhost",
+                len([a for a in answers.values() if a]),
+                form_version
+            ))
+            # Materialized stats are updated in the same transaction
+            if form is not None:
+                stats.record_response(conn, form, answers)
+    return response_id
+
+
+@instrument('storage.save_responses_batch')
+def save_responses_batch(records):
+    """Insert many responses in a single transaction and return how many were new
+
+    Each record is a dict with id, form_id, answers and submitted_at
+    (user_agent, ip_address and form_version are optional). Records whose
+    id is already stored are skipped, so replaying a batch is harmless, and
+    responses to forms that no longer exist are dropped. Stats are updated
+    once per form.
+    """
+    forms = {}
+    for record in records:
+        if record['form_id'] not in forms:
+            forms[record['form_id']] = get_form_definition(record['form_id'])
+
+    # Encode before taking a connection: version lookups use the pool too
+    prepared = []
+    for record in records:
+        form = forms[record['form_id']]
+        if form is None:
+            continue
+        answers = encode_answers(_answer_questions(form, record.get('form_version')), record['answers'])
+        prepared.append((record, form, answers, _stored_answers(form['id'], record.get('form_version'), answers)))
+
+    accumulators = {}
+    inserted = 0
+    with get_pool().connection() as conn:
+        with conn:
+            for record, form, answers, stored in prepared:
+                cursor = conn.execute(SQL_SAVE_RESPONSE_IF_NEW, (
+                    record['id'],
+                    record['form_id'],
+                    stored,
+                    record['submitted_at'],
+                    record.get('user_agent', "Streamlit App"),
+                    record.get('ip_address', "localhost"),
+                    len([a for a in answers.values() if a]),
+                    record.get('form_version')
+                ))
+                if cursor.rowcount:
+                    inserted += 1
+                    if form['id'] not in accumulators:
+                        accumulators[form['id']] = stats.StatsAccumulator(form['questions'])
+                    accumulators[form['id']].add(answers)
+
+            for form_id, accumulator in accumulators.items():
+                accumulator.apply(conn, form_id, forms[form_id]['questions_hash'])
+    return inserted
+
+
+@instrument('storage.save_responses_bulk')
+def save_responses_bulk(form, records):
+    """Insert many responses to one form with executemany in a single transaction
+
+    Records are shaped as for save_responses_batch; their answers are
+    re-keyed by question id in place. Returns how many were new. When some
+    ids were already stored the per-row stats deltas are unknown, so the
+    form's stats row is dropped and rebuilt on next read.
+    """
+    for record in records:
+        record['answers'] = encode_answers(_answer_questions(form, record.get('form_version')), record['answers'])
+
+    rows = [(
+        record['id'],
+        form['id'],
+        _stored_answers(form['id'], record.get('form_version'), record['answers']),
+        record['submitted_at'],
+        record.get('user_agent', "Bulk Import"),
+        record.get('ip_address', "localhost"),
+        len([a for a in record['answers'].values() if a]),
+        record.get('form_version')
+    ) for record in records]
+
+    with get_pool().connection() as conn:
+        with conn:
+            before = conn.total_changes
+            conn.executemany(SQL_SAVE_RESPONSE_IF_NEW, rows)
+            inserted = conn.total_changes - before
+
+            stats_current = False
+            if inserted == len(rows):
+                accumulator = stats.StatsAccumulator(form['questions'])
+                for record in records:
+                    accumulator.add(record['answers'])
+                stats_current = accumulator.apply(conn, form['id'], form['questions_hash'])
+            if not stats_current:
+                conn.execute('DELETE FROM form_stats WHERE form_id = ?', (form['id'],))
+    return inserted
+
+
+@instrument('storage.get_form_responses')
+def get_form_responses(form_id):
+    with get_pool().connection() as conn:
+        results = conn.execute(SQL_FORM_RESPONSES, (form_id,)).fetchall()
+
+    return [{
+        'id': r[0],
+        'form_id': r[1],
+        'answers': decode_stored_answers(r[1], r[7], r[2]),
+        'submitted_at': r[3],
+        'user_agent': r[4],
+        'ip_address': r[5],
+        'form_version': r[7]
+    } for r in results]
+
+
+def iter_form_responses(form_id, batch_size=1000):
+    """Yield a form's responses newest first, one keyset-paginated batch at a time
+
+    Memory stays bounded by batch_size however many responses the form has,
+    and no read transaction is held open between batches.
+    """
+    last = None
+    while True:
+        with get_pool().connection() as conn:
+            if last is None:
+                rows = conn.execute(SQL_RESPONSES_FIRST_PAGE, (form_id, batch_size)).fetchall()
+            else:
+                rows = conn.execute(SQL_RESPONSES_NEXT_PAGE, (form_id, *last, batch_size)).fetchall()
+
+        for r in rows:
+            yield {
+                'id': r[0],
+                'form_id': r[1],
+                'answers': decode_stored_answers(r[1], r[7], r[2]),
+                'submitted_at': r[3],
+                'user_agent': r[4],
+                'ip_address': r[5],
+                'form_version': r[7]
+            }
+
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1][3], rows[-1][0])
+
+
+@instrument('storage.get_response_page')
+def get_response_page(form_id, total_questions, status=None, newest_first=True, after=None, limit=20):
+    """One page of a form's responses, filtered and ordered in SQL
+
+    after is the (submitted_at, id) of the last response on the previous
+    page; the next page is read with a keyset seek on the
+    (form_id, submitted_at, id) index, so deep pages cost the same as the first.
+    """
+    conditions = ['form_id = :form_id']
+    params = {'form_id': form_id, 'total': total_questions, 'limit': limit}
+
+    if status in SQL_STATUS_FILTERS:
+        conditions.append(SQL_STATUS_FILTERS[status])
+
+    if after is not None:
+        conditions.append('(submitted_at, id) < (:after_at, :after_id)' if newest_first
+                          else '(submitted_at, id) > (:after_at, :after_id)')
+        params['after_at'], params['after_id'] = after
+
+    direction = 'DESC' if newest_first else 'ASC'
+    query = f'''
+        SELECT id, form_id, answers, submitted_at, user_agent, ip_address, form_version
+        FROM responses WHERE {' AND '.join(conditions)}
+        ORDER BY submitted_at {direction}, id {direction} LIMIT :limit
+    '''
+    with get_pool().connection() as conn:
+        results = conn.execute(query, params).fetchall()
+
+    return [{
+        'id': r[0],
+        'form_id': r[1],
+        'answers': decode_stored_answers(r[1], r[6], r[2]),
+        'submitted_at': r[3],
+        'user_agent': r[4],
+        'ip_address': r[5],
+        'form_version': r[6]
+    } for r in results]
+
+
+def compact_stored_answers(form_id, batch_size=1000):
+    """Re-encode a form's JSON answers in the compact format where possible
+
+    Only responses that recorded their form version can be encoded. Returns
+    the number of rows converted; run VACUUM afterwards to reclaim space.
+    """
+    converted = 0
+    last_rowid = 0
+    while True:
+        with get_pool().connection() as conn:
+            rows = conn.execute('''
+                SELECT rowid, form_version, answers FROM responses
+                WHERE form_id = ? AND rowid > ? AND form_version IS NOT NULL AND typeof(answers) = 'text'
+                ORDER BY rowid LIMIT ?
+            ''', (form_id, last_rowid, batch_size)).fetchall()
+        if not rows:
+            return converted
+
+        updates = []
+        for rowid, form_version, answers in rows:
+            version = get_form_version(form_id, form_version)
+            data = pack_answers(version['questions'], json.loads(answers)) if version else None
+            if data is not None:
+                updates.append((data, rowid))
+
+        with get_pool().connection() as conn:
+            with conn:
+                conn.executemany('UPDATE responses SET answers = ? WHERE rowid = ?', updates)
+        converted += len(updates)
+        last_rowid = rows[-1][0]
+
+
+@instrument('storage.save_drafts')
+def save_drafts(drafts):
+    """Upsert many drafts in one transaction and return how many were written
+
+    Each draft is a dict with token, form_id, form_version, answers (keyed
+    by question index or id) and optionally pages. Drafts of forms that no
+    longer exist are dropped.
+    """
+    forms = {}
+    rows = []
+    now = datetime.now()
+    for draft in drafts:
+        form_id = draft['form_id']
+        if form_id not in forms:
+            forms[form_id] = get_form_definition(form_id)
+        form = forms[form_id]
+        if form is None:
+            continue
+        answers = encode_answers(_answer_questions(form, draft.get('form_version')), draft['answers'])
+        pages = draft.get('pages')
+        rows.append((
+            draft['token'],
+            form_id,
+            draft.get('form_version'),
+            json.dumps(answers),
+            json.dumps(pages) if pages is not None else None,
+            now
+        ))
+
+    with get_pool().connection() as conn:
+        with conn:
+            conn.executemany(SQL_SAVE_DRAFT, rows)
+    return len(rows)
+
+
+@instrument('storage.load_draft')
+def load_draft(token):
+    """Stored draft for a resume token (answers keyed by question id), or None"""
+    with get_pool().connection() as conn:
+        row = conn.execute(SQL_LOAD_DRAFT, (token,)).fetchone()
+
+    if row is None:
+        return None
+    return {
+        'token': token,
+        'form_id': row[0],
+        'form_version': row[1],
+        'answers': json.loads(row[2]),
+        'pages': json.loads(row[3]) if row[3] else None,
+        'updated_at': row[4]
+    }
+
+
+@instrument('storage.delete_draft')
+def delete_draft(token):
+    with get_pool().connection() as conn:
+        with conn:
+            conn.execute(SQL_DELETE_DRAFT, (token,))
+
+
+@instrument('storage.delete_drafts')
+def delete_drafts(tokens):
+    """Delete many drafts in one transaction"""
+    with get_pool().connection() as conn:
+        with conn:
+            conn.executemany(SQL_DELETE_DRAFT, [(token,) for token in tokens])
+
+
+@instrument('storage.delete_expired_drafts')
+def delete_expired_drafts(max_age):
+    """Delete drafts not updated for max_age (a timedelta); returns how many"""
+    with get_pool().connection() as conn:
+        with conn:
+            cursor = conn.execute(SQL_DELETE_EXPIRED_DRAFTS, (datetime.now() - max_age,))
+    return cursor.rowcount
+
+
+@instrument('storage.delete_form')
+def delete_form(form_id):
+    with get_pool().connection() as conn:
+        with conn:
+            # Responses and versions are removed by ON DELETE CASCADE foreign keys
+            conn.execute(SQL_DELETE_FORM, (form_id,))
+    _form_cache.invalidate(form_id)
+    # Version snapshots are cached per (form id, hash); deletes are rare enough to drop them all
+    _version_cache.clear()
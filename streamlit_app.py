@@ -1,11 +1,25 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import json
+import os
+import time
 import uuid
+from collections import deque
 from datetime import datetime
-import base64
-from io import BytesIO
+
+# pandas and the exporters are imported in show_responses_viewer: respondents never need them
+from storage import (
+    init_database, save_form, load_form, get_form_definition, get_all_forms,
+    get_response_page, get_published_form, get_form_version, get_form_versions
+)
+import storage
+import metrics
+import profiling
+from stats import get_form_summary
+from analytics import count_responses_by_version
+from submission_queue import start_submission_queue, submit_response
+from form_logic import PAGE_LAYOUTS, calculate_screening_status, get_compiled_logic
+from validation import REQUIRED_MESSAGE, get_validator, normalize_answer_keys
+from question_ids import new_question_id, question_index_by_id
+from drafts import new_draft_token, save_draft, load_draft, discard_draft
 
 # Page configuration
 st.set_page_config(
@@ -21,212 +35,29 @@ QUESTION_TYPES = [
     "Dropdown", "Number", "Email", "Scale", "Grid", "Likert Scale", "Multiple Grids"
 ]
 
-# Database setup
-def init_database():
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    # Create forms table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS forms (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            questions TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_published BOOLEAN DEFAULT FALSE,
-            settings TEXT
-        )
-    ''')
-    
-    # Create responses table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS responses (
-            id TEXT PRIMARY KEY,
-            form_id TEXT NOT NULL,
-            answers TEXT NOT NULL,
-            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            user_agent TEXT,
-            ip_address TEXT,
-            FOREIGN KEY (form_id) REFERENCES forms (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Individual responses shown per page in the response viewer
+RESPONSES_PAGE_SIZE = 20
 
-# Initialize database
-init_database()
+# Sidebar panel with the timings of this session's last reruns (FORMS_PERF_PANEL=1)
+PERF_PANEL = os.environ.get('FORMS_PERF_PANEL', '') == '1'
+PERF_HISTORY = 20
 
-# Helper functions
-def generate_unique_id():
-    return f"form_{int(datetime.now().timestamp())}_{str(uuid.uuid4())[:8]}"
+# Browser-reachable base URL of the JSON API (api.py); with FORMS_EXPORT_SECRET set, CSV and
+# JSON Lines exports are streamed from it instead of passing through this process
+API_URL = os.environ.get('FORMS_API_URL', '')
 
-def save_form(form_data):
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO forms 
-        (id, title, questions, last_modified, is_published, settings)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        form_data['id'],
-        form_data['title'],
-        json.dumps(form_data['questions']),
-        datetime.now(),
-        form_data.get('is_published', False),
-        json.dumps(form_data.get('settings', {}))
-    ))
-    
-    conn.commit()
-    conn.close()
+@st.cache_resource
+def setup_process():
+    """Schema migration, spool recovery and background exporters, once per server process rather than per rerun"""
+    init_database()
+    start_submission_queue()
+    metrics.start_file_exporter()
 
-def load_form(form_id):
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM forms WHERE id = ?', (form_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        return {
-            'id': result[0],
-            'title': result[1],
-            'questions': json.loads(result[2]),
-            'created_at': result[3],
-            'last_modified': result[4],
-            'is_published': bool(result[5]),
-            'settings': json.loads(result[6]) if result[6] else {}
-        }
-    return None
+setup_process()
 
-def get_all_forms():
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT id, title, created_at, is_published FROM forms ORDER BY last_modified DESC')
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [{'id': r[0], 'title': r[1], 'created_at': r[2], 'is_published': bool(r[3])} for r in results]
-
-def save_response(form_id, answers):
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    response_id = str(uuid.uuid4())
-    cursor.execute('''
-        INSERT INTO responses 
-        (id, form_id, answers, submitted_at, user_agent, ip_address)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        response_id,
-        form_id,
-        json.dumps(answers),
-        datetime.now(),
-        "Streamlit App",
-        "localhost"
-    ))
-    
-    conn.commit()
-    conn.close()
-    return response_id
-
-def get_form_responses(form_id):
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM responses WHERE form_id = ? ORDER BY submitted_at DESC', (form_id,))
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [{
-        'id': r[0],
-        'form_id': r[1],
-        'answers': json.loads(r[2]),
-        'submitted_at': r[3],
-        'user_agent': r[4],
-        'ip_address': r[5]
-    } for r in results]
-
-def calculate_screening_status(answers, total_questions):
-    answered = len([a for a in answers.values() if a])
-    percentage = answered / total_questions if total_questions > 0 else 0
-    
-    if percentage == 1.0:
-        return "Passed"
-    elif percentage > 0.5:
-        return "Pending"
-    else:
-        return "Failed"
-
-def check_skip_logic(question, answer, all_questions):
-    """Check if skip logic should be applied based on the answer"""
-    if 'skipLogic' not in question or not question['skipLogic']:
-        return None
-    
-    for rule in question['skipLogic']:
-        should_skip = False
-        
-        if question['type'] in ['multiple-choice', 'dropdown', 'likert']:
-            should_skip = answer == rule.get('option')
-        elif question['type'] == 'checkbox':
-            should_skip = isinstance(answer, list) and rule.get('option') in answer
-        elif question['type'] in ['short-text', 'paragraph', 'email']:
-            should_skip = answer == rule.get('value')
-        elif question['type'] in ['number', 'scale']:
-            operator = rule.get('operator', 'equals')
-            value = rule.get('value')
-            if operator == 'equals':
-                should_skip = answer == value
-            elif operator == 'greater':
-                should_skip = answer > value
-            elif operator == 'less':
-                should_skip = answer < value
-        
-        if should_skip:
-            return rule.get('target')
-    
-    return None
-
-def should_hide_option(question, option_value, all_answers, all_questions):
-    """Check if an option should be hidden based on option rules"""
-    if 'optionRules' not in question or not question['optionRules']:
-        return False
-    
-    for rule in question['optionRules']:
-        source_question_idx = rule.get('sourceQuestion')
-        source_value = rule.get('sourceValue')
-        hidden_options = rule.get('hiddenOptions', [])
-        
-        # Debug information
-        # st.write(f"DEBUG - Rule: source_q={source_question_idx}, source_val={source_value}, hidden={hidden_options}")
-        # st.write(f"DEBUG - Checking option: {option_value}, answers: {all_answers}")
-        
-        if (source_question_idx is not None and 
-            source_value and 
-            option_value in hidden_options):
-            
-            # Get the answer from the source question
-            source_answer = all_answers.get(source_question_idx)
-            
-            # Handle different answer types
-            if isinstance(source_answer, list):
-                # For checkbox answers
-                if source_value in source_answer:
-                    return True
-            elif isinstance(source_answer, str):
-                # For text/dropdown/radio answers
-                if source_answer == source_value:
-                    return True
-            elif source_answer is not None:
-                # For numeric answers, convert to string for comparison
-                if str(source_answer) == str(source_value):
-                    return True
-    
-    return False
+# Helper functions
+def generate_unique_id():
+    return f"form_{int(datetime.now().timestamp())}_{str(uuid.uuid4())[:8]}"
 
 # Initialize session state
 if 'current_form' not in st.session_state:
@@ -296,12 +127,7 @@ def show_forms_list():
                     st.rerun()
 
 def delete_form(form_id):
-    conn = sqlite3.connect('forms.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM forms WHERE id = ?', (form_id,))
-    cursor.execute('DELETE FROM responses WHERE form_id = ?', (form_id,))
-    conn.commit()
-    conn.close()
+    storage.delete_form(form_id)
     st.success("Form deleted successfully!")
 
 def show_form_builder():
@@ -328,6 +154,9 @@ def show_form_builder():
             st.metric("Questions", len(st.session_state.current_form['questions']))
         with col3:
             status = "Published" if st.session_state.current_form['is_published'] else "Draft"
+            versions = get_form_versions(st.session_state.current_form['id'])
+            if versions and st.session_state.current_form['is_published']:
+                status += f" (v{versions[0]['version_number']})"
             st.metric("Status", status)
     
     # Advanced form settings
@@ -349,10 +178,20 @@ def show_form_builder():
             value=settings.get('require_full_completion', True)
         )
         
+        layouts = list(PAGE_LAYOUTS)
+        layout = st.selectbox(
+            "Page layout:",
+            layouts,
+            index=layouts.index(settings.get('layout', 'all')),
+            format_func=PAGE_LAYOUTS.get,
+            help="Long forms render faster one question or section at a time. Sections start at questions marked 'Start a new section'."
+        )
+        
         st.session_state.current_form['settings'] = {
             'custom_message': custom_message,
             'enable_screening': enable_screening,
-            'require_full_completion': require_full_completion
+            'require_full_completion': require_full_completion,
+            'layout': layout
         }
     
     # Question builder
@@ -367,6 +206,7 @@ def show_form_builder():
         question_text = st.text_input("Question Text")
         description = st.text_input("Description (optional)")
         required = st.checkbox("Required")
+        page_break = st.checkbox("Start a new section (page) with this question")
         
         # Question-specific options
         options = []
@@ -452,7 +292,9 @@ def show_form_builder():
         
         if st.form_submit_button("Add Question"):
             if question_text:
+                existing_ids = {q.get('id') for q in st.session_state.current_form['questions']}
                 question_data = {
+                    'id': new_question_id(existing_ids),
                     'text': question_text,
                     'description': description,
                     'type': question_type.lower().replace(' ', '-'),
@@ -462,6 +304,9 @@ def show_form_builder():
                 if options:
                     question_data['options'] = options
                 
+                if page_break:
+                    question_data['pageBreak'] = True
+                
                 if enable_skip_logic and skip_rules:
                     question_data['skipLogic'] = skip_rules
                 
@@ -481,6 +326,8 @@ def show_form_builder():
                 with col1:
                     st.write(f"**Type:** {q['type'].title()}")
                     st.write(f"**Required:** {'Yes' if q['required'] else 'No'}")
+                    if q.get('pageBreak'):
+                        st.write("**Starts a new section**")
                     if 'options' in q:
                         st.write(f"**Options:** {', '.join(q['options'])}")
                     if 'skipLogic' in q:
@@ -626,6 +473,290 @@ Thank you for your time!"""
             st.text_area("Email Subject:", email_subject, height=50)
             st.text_area("Email Body:", email_body, height=150)
 
+def set_answer(form_data, answers, question_idx, new_answer, edited=True):
+    """Store an answer from a question fragment
+
+    edited is False when a widget merely reports the value it shows by
+    default (number and scale inputs on first render). That value is
+    recorded, but doesn't start a draft or redraw the page: only real edits
+    do.
+
+    Visible questions and hidden options are updated from the changed
+    question only. The whole page reruns when that shows or hides questions,
+    changes another question's options or changes whether this question is
+    answered (the progress panel); otherwise only the question's own
+    fragment has rerun.
+    """
+    form_id = form_data['id']
+    was_answered = bool(answers.get(question_idx))
+    answers[question_idx] = new_answer
+
+    logic = get_compiled_logic(form_data)
+    changed = {question_idx}
+    last_modified, visible_indices = st.session_state[f'visible_{form_id}']
+    _, hidden_options = st.session_state[f'hidden_{form_id}']
+    dependents = logic.option_rules.dependents.get(question_idx, ())
+
+    with metrics.timed('filler.option_filtering'):
+        new_hidden = logic.option_rules.update_hidden_options(hidden_options, answers, changed)
+        # Answers of dependent questions that chose a now-hidden option are dropped, not just undisplayed
+        new_hidden, dropped = logic.option_rules.drop_hidden_answers(answers, new_hidden, dependents)
+    with metrics.timed('filler.visibility'):
+        new_visible = logic.skip_logic.update_visible_questions(visible_indices, answers, changed | dropped)
+    st.session_state[f'visible_{form_id}'] = (last_modified, new_visible)
+    st.session_state[f'hidden_{form_id}'] = (last_modified, new_hidden)
+    st.session_state[f'answers_{form_id}'] = answers
+    if edited:
+        save_filler_draft(form_data, answers)
+
+    # A full rerun also redraws the progress panel, so do one when the answered count changes
+    if dropped or (edited and was_answered != bool(new_answer)) or new_visible != visible_indices or any(
+        new_hidden.get(idx) != hidden_options.get(idx) for idx in dependents
+    ):
+        st.rerun()
+
+def save_filler_draft(form_data, answers, flush=False):
+    """Save the filler's answers and wizard page as a draft resumable from the page URL"""
+    form_id = form_data['id']
+    token = st.session_state.get(f'draft_{form_id}')
+    if token is None:
+        token = new_draft_token()
+        st.session_state[f'draft_{form_id}'] = token
+        st.query_params['form_id'] = form_id
+        st.query_params['draft'] = token
+    save_draft(token, form_id, form_data['version'], answers,
+               st.session_state.get(f'pages_{form_id}'), flush=flush)
+
+def discard_filler_draft(form_id):
+    token = st.session_state.pop(f'draft_{form_id}', None)
+    if token is not None:
+        discard_draft(token)
+    if 'draft' in st.query_params:
+        del st.query_params['draft']
+
+def show_answer_errors(errors):
+    for question_idx, message in sorted(errors.items()):
+        if message == REQUIRED_MESSAGE:
+            st.error(f"Question {question_idx + 1} is required!")
+        else:
+            st.error(f"Question {question_idx + 1}: {message}")
+
+@st.fragment
+def render_question(form_data, question_idx):
+    """One question of the filler; answering it reruns only this fragment"""
+    form_id = form_data['id']
+    question = form_data['questions'][question_idx]
+    answers = st.session_state[f'answers_{form_id}']
+    hidden_options = st.session_state[f'hidden_{form_id}'][1]
+
+    with st.container():
+        st.write(f"**Question {question_idx + 1}:** {question['text']}")
+        if question.get('description'):
+            st.caption(question['description'])
+        
+        q_type = question['type']
+        key = f"q_{question_idx}_live"
+        current_answer = answers.get(question_idx, '')
+        
+        # Handle different question types with dynamic option filtering
+        if q_type == 'short-text':
+            new_answer = st.text_input("Your answer:", value=current_answer, key=key)
+            if new_answer != current_answer:
+                set_answer(form_data, answers, question_idx, new_answer)
+        
+        elif q_type == 'paragraph':
+            new_answer = st.text_area("Your answer:", value=current_answer, key=key)
+            if new_answer != current_answer:
+                set_answer(form_data, answers, question_idx, new_answer)
+        
+        elif q_type == 'multiple-choice':
+            # Filter options based on option rules
+            all_options = question.get('options', [])
+            available_options = []
+            hidden_count = 0
+            
+            question_hidden = hidden_options.get(question_idx, ())
+            for opt in all_options:
+                if opt in question_hidden:
+                    hidden_count += 1
+                else:
+                    available_options.append(opt)
+            
+            if hidden_count > 0:
+                st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
+            
+            if available_options:
+                if current_answer not in available_options:
+                    current_answer = ""  # Reset if current answer is now hidden
+                
+                new_answer = st.radio(
+                    "Select one:",
+                    options=[""] + available_options,
+                    index=([""] + available_options).index(current_answer) if current_answer in available_options else 0,
+                    key=key
+                )
+                
+                if new_answer != current_answer:
+                    set_answer(form_data, answers, question_idx, new_answer)
+            else:
+                st.warning("No options available based on previous answers.")
+                new_answer = ""
+        
+        elif q_type == 'checkboxes':
+            all_options = question.get('options', [])
+            available_options = []
+            hidden_count = 0
+            
+            question_hidden = hidden_options.get(question_idx, ())
+            for opt in all_options:
+                if opt in question_hidden:
+                    hidden_count += 1
+                else:
+                    available_options.append(opt)
+            
+            if hidden_count > 0:
+                st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
+            
+            if available_options:
+                st.write("Select all that apply:")
+                selected = []
+                current_selected = current_answer if isinstance(current_answer, list) else []
+                
+                # Filter out hidden options from current selection
+                current_selected = [opt for opt in current_selected if opt in available_options]
+                
+                for opt in available_options:
+                    if st.checkbox(opt, value=opt in current_selected, key=f"{key}_{opt}"):
+                        selected.append(opt)
+                
+                if selected != current_selected:
+                    set_answer(form_data, answers, question_idx, selected)
+            else:
+                st.warning("No options available based on previous answers.")
+        
+        elif q_type == 'dropdown':
+            all_options = question.get('options', [])
+            available_options = []
+            hidden_count = 0
+            
+            question_hidden = hidden_options.get(question_idx, ())
+            for opt in all_options:
+                if opt in question_hidden:
+                    hidden_count += 1
+                else:
+                    available_options.append(opt)
+            
+            if hidden_count > 0:
+                st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
+            
+            if available_options:
+                options_with_empty = ["Select an option..."] + available_options
+                
+                if current_answer not in available_options:
+                    current_answer = ""  # Reset if current answer is now hidden
+                
+                default_idx = options_with_empty.index(current_answer) if current_answer in available_options else 0
+                
+                new_answer = st.selectbox("Choose:", options_with_empty, index=default_idx, key=key)
+                if new_answer == "Select an option...":
+                    new_answer = ""
+                
+                if new_answer != current_answer:
+                    set_answer(form_data, answers, question_idx, new_answer)
+            else:
+                st.warning("No options available based on previous answers.")
+        
+        elif q_type == 'number':
+            shown = float(current_answer) if current_answer else 0.0
+            new_answer = st.number_input("Enter number:", value=shown, key=key)
+            if new_answer != current_answer:
+                set_answer(form_data, answers, question_idx, new_answer, edited=new_answer != shown)
+        
+        elif q_type == 'email':
+            new_answer = st.text_input("Enter email:", value=current_answer, key=key, placeholder="email@example.com")
+            if new_answer != current_answer:
+                set_answer(form_data, answers, question_idx, new_answer)
+        
+        elif q_type == 'scale':
+            options = question.get('options', [str(i) for i in range(1, 11)])
+            min_val, max_val = int(options[0]), int(options[-1])
+            default_val = int(current_answer) if current_answer else min_val
+            new_answer = st.slider("Rate:", min_val, max_val, default_val, key=key)
+            if new_answer != current_answer:
+                set_answer(form_data, answers, question_idx, new_answer, edited=new_answer != default_val)
+        
+        elif q_type == 'likert-scale':
+            all_options = question.get('options', [])
+            available_options = []
+            hidden_count = 0
+            
+            question_hidden = hidden_options.get(question_idx, ())
+            for opt in all_options:
+                if opt in question_hidden:
+                    hidden_count += 1
+                else:
+                    available_options.append(opt)
+            
+            if hidden_count > 0:
+                st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
+            
+            if available_options:
+                if current_answer not in available_options:
+                    current_answer = available_options[0] if available_options else ""
+                
+                new_answer = st.select_slider("Rate:", available_options, value=current_answer, key=key)
+                if new_answer != current_answer:
+                    set_answer(form_data, answers, question_idx, new_answer)
+            else:
+                st.warning("No options available based on previous answers.")
+        
+        # Show logic info if applicable
+        logic_info = []
+        if question.get('skipLogic'):
+            logic_info.append(f"Skip logic: {len(question['skipLogic'])} rule(s)")
+        if question.get('optionRules'):
+            logic_info.append(f"Option rules: {len(question['optionRules'])} rule(s)")
+        
+        if logic_info:
+            st.caption("🔀 " + " • ".join(logic_info))
+        
+        if question['required']:
+            st.caption("⚠️ Required field")
+        
+        st.write("---")
+
+def render_progress(form_data):
+    """Progress bar and answer summary
+
+    Drawn on full page reruns only. set_answer triggers one whenever the
+    number of answered questions changes, so the progress stays current;
+    edits to an already answered question show up with the next full rerun.
+    """
+    form_id = form_data['id']
+    answers = st.session_state.get(f'answers_{form_id}', {})
+
+    progress = len([i for i in answers.keys() if answers[i]]) / len(form_data['questions']) if form_data['questions'] else 0
+    st.progress(progress)
+    st.caption(f"Progress: {int(progress * 100)}% ({len([i for i in answers.keys() if answers[i]])}/{len(form_data['questions'])} questions answered)")
+
+    
+    # Show current answers
+    if answers:
+        st.write("**Current Answers:**")
+        for q_idx, answer in answers.items():
+            if answer:
+                question_text = form_data['questions'][q_idx]['text'][:30] + "..."
+                answer_display = answer
+                if isinstance(answer, list):
+                    answer_display = ", ".join(answer)
+                st.write(f"Q{q_idx + 1}: {answer_display}")
+    
+    # Show form stats
+    st.write("**Form Statistics:**")
+    st.write(f"Total Questions: {len(form_data['questions'])}")
+    st.write(f"Answered: {len([a for a in answers.values() if a])}")
+    st.write(f"Remaining: {len(form_data['questions']) - len([a for a in answers.values() if a])}")
+
 def show_form_filler():
     st.header("📝 Fill Form")
     
@@ -636,266 +767,128 @@ def show_form_filler():
         form_id = st.text_input("Enter Form ID:")
     
     if form_id:
-        form_data = load_form(form_id)
+        published = get_published_form(form_id)
         
-        if not form_data:
-            st.error("Form not found!")
+        if not published:
+            if get_form_definition(form_id) is None:
+                st.error("Form not found!")
+            else:
+                st.warning("This form is not published yet.")
             return
         
-        if not form_data['is_published']:
-            st.warning("This form is not published yet.")
-            return
+        # Resume a saved draft (?draft=<token>) the first time this session opens the form
+        draft = None
+        draft_token = st.query_params.get('draft')
+        if draft_token and f'answers_{form_id}' not in st.session_state:
+            draft = load_draft(draft_token)
+            if draft is not None and draft['form_id'] != form_id:
+                draft = None
+        
+        # Keep the respondent on the version they started, even if a newer one is published meanwhile
+        version_key = f'version_{form_id}'
+        if draft and draft['form_version'] and get_form_version(form_id, draft['form_version']):
+            st.session_state[version_key] = draft['form_version']
+        if version_key not in st.session_state:
+            st.session_state[version_key] = published['version']
+        form_data = get_form_version(form_id, st.session_state[version_key]) or published
+        metrics.tag_rerun(form_id)
         
         st.subheader(form_data['title'])
         
         # Initialize answers in session state for dynamic form handling
         if f'answers_{form_id}' not in st.session_state:
             st.session_state[f'answers_{form_id}'] = {}
+            st.session_state.pop(f'visible_{form_id}', None)
+            st.session_state.pop(f'hidden_{form_id}', None)
+            st.session_state.pop(f'pages_{form_id}', None)
+            if draft:
+                index_by_id = question_index_by_id(form_data['questions'])
+                st.session_state[f'answers_{form_id}'] = normalize_answer_keys(draft['answers'], index_by_id)
+                if draft['pages']:
+                    st.session_state[f'pages_{form_id}'] = draft['pages']
+                st.session_state[f'draft_{form_id}'] = draft_token
+                st.info("📂 Your saved progress has been restored.")
         
         answers = st.session_state[f'answers_{form_id}']
         
-        # Determine which questions to show based on skip logic
-        visible_questions = []
-        current_idx = 0
-        
-        while current_idx < len(form_data['questions']):
-            question = form_data['questions'][current_idx]
-            visible_questions.append((current_idx, question))
-            
-            # Check if we should skip questions based on previous answers
-            if current_idx in answers:
-                skip_target = check_skip_logic(question, answers[current_idx], form_data['questions'])
-                if skip_target == "end":
-                    break
-                elif skip_target is not None and skip_target > current_idx:
-                    current_idx = skip_target
-                    continue
-            
-            current_idx += 1
-        
-        # Show progress
-        progress = len([i for i in answers.keys() if answers[i]]) / len(form_data['questions']) if form_data['questions'] else 0
-        st.progress(progress)
-        st.caption(f"Progress: {int(progress * 100)}% ({len([i for i in answers.keys() if answers[i]])}/{len(form_data['questions'])} questions answered)")
+        # Visible questions and hidden options are computed once per form
+        # version here; question fragments update them incrementally
+        logic = get_compiled_logic(form_data)
+        visible_key = f'visible_{form_id}'
+        cached_visible = st.session_state.get(visible_key)
+
+        if cached_visible and cached_visible[0] == form_data['last_modified']:
+            visible_indices = cached_visible[1]
+        else:
+            with metrics.timed('filler.visibility'):
+                visible_indices = logic.skip_logic.visible_questions(answers)
+            st.session_state[visible_key] = (form_data['last_modified'], visible_indices)
+
+        hidden_key = f'hidden_{form_id}'
+        cached_hidden = st.session_state.get(hidden_key)
+
+        if not (cached_hidden and cached_hidden[0] == form_data['last_modified']):
+            with metrics.timed('filler.option_filtering'):
+                st.session_state[hidden_key] = (form_data['last_modified'], logic.option_rules.hidden_options(answers))
+
+        # The wizard layouts only build the widgets of the current page
+        layout = form_data.get('settings', {}).get('layout', 'all')
+        paged = layout in ('question', 'section') and bool(form_data['questions'])
+        if paged:
+            page_starts = st.session_state.get(f'pages_{form_id}')
+            if not page_starts or page_starts[-1] >= len(form_data['questions']):
+                page_starts = [0]
+                st.session_state[f'pages_{form_id}'] = page_starts
+            with metrics.timed('filler.paging'):
+                page_indices = logic.page(page_starts[-1], answers, layout)
+                next_page_start = logic.next_page_start(page_indices, answers)
+        else:
+            page_indices = visible_indices
+            next_page_start = None
         
         # Show option hiding demo info
-        if any(q.get('optionRules') for _, q in visible_questions):
+        if any(form_data['questions'][idx].get('optionRules') for idx in page_indices):
             st.info("🔀 This form contains dynamic option filtering - some options will hide/show based on your previous answers!")
         
-        # Create form with dynamic questions - use columns for better real-time updates
+        # Each question is its own fragment so answering one doesn't rerun the page
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            # Process each question individually for better reactivity
-            for question_idx, question in visible_questions:
-                with st.container():
-                    st.write(f"**Question {question_idx + 1}:** {question['text']}")
-                    if question.get('description'):
-                        st.caption(question['description'])
-                    
-                    q_type = question['type']
-                    key = f"q_{question_idx}_live"
-                    current_answer = answers.get(question_idx, '')
-                    
-                    # Handle different question types with dynamic option filtering
-                    if q_type == 'short-text':
-                        new_answer = st.text_input("Your answer:", value=current_answer, key=key)
-                        if new_answer != current_answer:
-                            answers[question_idx] = new_answer
-                            st.session_state[f'answers_{form_id}'] = answers
-                            st.rerun()
-                    
-                    elif q_type == 'paragraph':
-                        new_answer = st.text_area("Your answer:", value=current_answer, key=key)
-                        if new_answer != current_answer:
-                            answers[question_idx] = new_answer
-                            st.session_state[f'answers_{form_id}'] = answers
-                            st.rerun()
-                    
-                    elif q_type == 'multiple-choice':
-                        # Filter options based on option rules
-                        all_options = question.get('options', [])
-                        available_options = []
-                        hidden_count = 0
-                        
-                        for opt in all_options:
-                            if should_hide_option(question, opt, answers, form_data['questions']):
-                                hidden_count += 1
-                            else:
-                                available_options.append(opt)
-                        
-                        if hidden_count > 0:
-                            st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
-                        
-                        if available_options:
-                            if current_answer not in available_options:
-                                current_answer = ""  # Reset if current answer is now hidden
-                            
-                            new_answer = st.radio(
-                                "Select one:",
-                                options=[""] + available_options,
-                                index=([""] + available_options).index(current_answer) if current_answer in available_options else 0,
-                                key=key
-                            )
-                            
-                            if new_answer != current_answer:
-                                answers[question_idx] = new_answer
-                                st.session_state[f'answers_{form_id}'] = answers
-                                st.rerun()
-                        else:
-                            st.warning("No options available based on previous answers.")
-                            new_answer = ""
-                    
-                    elif q_type == 'checkboxes':
-                        all_options = question.get('options', [])
-                        available_options = []
-                        hidden_count = 0
-                        
-                        for opt in all_options:
-                            if should_hide_option(question, opt, answers, form_data['questions']):
-                                hidden_count += 1
-                            else:
-                                available_options.append(opt)
-                        
-                        if hidden_count > 0:
-                            st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
-                        
-                        if available_options:
-                            st.write("Select all that apply:")
-                            selected = []
-                            current_selected = current_answer if isinstance(current_answer, list) else []
-                            
-                            # Filter out hidden options from current selection
-                            current_selected = [opt for opt in current_selected if opt in available_options]
-                            
-                            for opt in available_options:
-                                if st.checkbox(opt, value=opt in current_selected, key=f"{key}_{opt}"):
-                                    selected.append(opt)
-                            
-                            if selected != current_selected:
-                                answers[question_idx] = selected
-                                st.session_state[f'answers_{form_id}'] = answers
-                                st.rerun()
-                        else:
-                            st.warning("No options available based on previous answers.")
-                    
-                    elif q_type == 'dropdown':
-                        all_options = question.get('options', [])
-                        available_options = []
-                        hidden_count = 0
-                        
-                        for opt in all_options:
-                            if should_hide_option(question, opt, answers, form_data['questions']):
-                                hidden_count += 1
-                            else:
-                                available_options.append(opt)
-                        
-                        if hidden_count > 0:
-                            st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
-                        
-                        if available_options:
-                            options_with_empty = ["Select an option..."] + available_options
-                            
-                            if current_answer not in available_options:
-                                current_answer = ""  # Reset if current answer is now hidden
-                            
-                            default_idx = options_with_empty.index(current_answer) if current_answer in available_options else 0
-                            
-                            new_answer = st.selectbox("Choose:", options_with_empty, index=default_idx, key=key)
-                            if new_answer == "Select an option...":
-                                new_answer = ""
-                            
-                            if new_answer != current_answer:
-                                answers[question_idx] = new_answer
-                                st.session_state[f'answers_{form_id}'] = answers
-                                st.rerun()
-                        else:
-                            st.warning("No options available based on previous answers.")
-                    
-                    elif q_type == 'number':
-                        new_answer = st.number_input("Enter number:", value=float(current_answer) if current_answer else 0.0, key=key)
-                        if new_answer != current_answer:
-                            answers[question_idx] = new_answer
-                            st.session_state[f'answers_{form_id}'] = answers
-                            st.rerun()
-                    
-                    elif q_type == 'email':
-                        new_answer = st.text_input("Enter email:", value=current_answer, key=key, placeholder="email@example.com")
-                        if new_answer != current_answer:
-                            answers[question_idx] = new_answer
-                            st.session_state[f'answers_{form_id}'] = answers
-                            st.rerun()
-                    
-                    elif q_type == 'scale':
-                        options = question.get('options', [str(i) for i in range(1, 11)])
-                        min_val, max_val = int(options[0]), int(options[-1])
-                        default_val = int(current_answer) if current_answer else min_val
-                        new_answer = st.slider("Rate:", min_val, max_val, default_val, key=key)
-                        if new_answer != current_answer:
-                            answers[question_idx] = new_answer
-                            st.session_state[f'answers_{form_id}'] = answers
-                            st.rerun()
-                    
-                    elif q_type == 'likert-scale':
-                        all_options = question.get('options', [])
-                        available_options = []
-                        hidden_count = 0
-                        
-                        for opt in all_options:
-                            if should_hide_option(question, opt, answers, form_data['questions']):
-                                hidden_count += 1
-                            else:
-                                available_options.append(opt)
-                        
-                        if hidden_count > 0:
-                            st.caption(f"ℹ️ {hidden_count} option(s) hidden based on previous answers")
-                        
-                        if available_options:
-                            if current_answer not in available_options:
-                                current_answer = available_options[0] if available_options else ""
-                            
-                            new_answer = st.select_slider("Rate:", available_options, value=current_answer, key=key)
-                            if new_answer != current_answer:
-                                answers[question_idx] = new_answer
-                                st.session_state[f'answers_{form_id}'] = answers
-                                st.rerun()
-                        else:
-                            st.warning("No options available based on previous answers.")
-                    
-                    # Show logic info if applicable
-                    logic_info = []
-                    if question.get('skipLogic'):
-                        logic_info.append(f"Skip logic: {len(question['skipLogic'])} rule(s)")
-                    if question.get('optionRules'):
-                        logic_info.append(f"Option rules: {len(question['optionRules'])} rule(s)")
-                    
-                    if logic_info:
-                        st.caption("🔀 " + " • ".join(logic_info))
-                    
-                    if question['required']:
-                        st.caption("⚠️ Required field")
-                    
-                    st.write("---")
+            for question_idx in page_indices:
+                render_question(form_data, question_idx)
+            
+            if paged:
+                nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+                with nav_prev:
+                    if len(page_starts) > 1 and st.button("⬅️ Previous", use_container_width=True):
+                        page_starts.pop()
+                        save_filler_draft(form_data, answers)
+                        st.rerun()
+                with nav_info:
+                    st.caption(f"Page {len(page_starts)} of {logic.page_count(visible_indices, layout)}")
+                with nav_next:
+                    next_clicked = next_page_start is not None and st.button("Next ➡️", use_container_width=True)
+                
+                if next_clicked:
+                    # Only the questions on this page have to be valid to move on
+                    page_errors = {
+                        question_idx: message
+                        for question_idx, message in get_validator(form_data).validate(answers).items()
+                        if question_idx in page_indices
+                    }
+                    if page_errors:
+                        show_answer_errors(page_errors)
+                    else:
+                        page_starts.append(next_page_start)
+                        save_filler_draft(form_data, answers)
+                        st.rerun()
         
         with col2:
             st.subheader("📊 Progress")
-            
-            # Show current answers
-            if answers:
-                st.write("**Current Answers:**")
-                for q_idx, answer in answers.items():
-                    if answer:
-                        question_text = form_data['questions'][q_idx]['text'][:30] + "..."
-                        answer_display = answer
-                        if isinstance(answer, list):
-                            answer_display = ", ".join(answer)
-                        st.write(f"Q{q_idx + 1}: {answer_display}")
-            
-            # Show form stats
-            st.write("**Form Statistics:**")
-            st.write(f"Total Questions: {len(form_data['questions'])}")
-            st.write(f"Answered: {len([a for a in answers.values() if a])}")
-            st.write(f"Remaining: {len(form_data['questions']) - len([a for a in answers.values() if a])}")
+            render_progress(form_data)
+        
+        if next_page_start is not None:
+            return
         
         # Submit section
         st.subheader("🚀 Submit Response")
@@ -904,31 +897,36 @@ def show_form_filler():
         
         with col1:
             if st.button("💾 Save Progress", use_container_width=True):
-                st.session_state[f'answers_{form_id}'] = answers
-                st.success("Progress saved!")
+                save_filler_draft(form_data, answers, flush=True)
+                st.success("Progress saved! Bookmark this page to resume later.")
         
         with col2:
             if st.button("🔄 Reset Form", use_container_width=True):
+                discard_filler_draft(form_id)
                 st.session_state[f'answers_{form_id}'] = {}
+                st.session_state.pop(f'visible_{form_id}', None)
+                st.session_state.pop(f'hidden_{form_id}', None)
+                st.session_state.pop(f'pages_{form_id}', None)
+                st.session_state.pop(f'version_{form_id}', None)
                 st.rerun()
         
         with col3:
             if st.button("🚀 Submit Final Response", use_container_width=True):
-                # Validate required fields for visible questions only
-                valid = True
-                for question_idx, question in visible_questions:
-                    if question['required'] and not answers.get(question_idx):
-                        st.error(f"Question {question_idx + 1} is required!")
-                        valid = False
+                # Validate answers (required fields only for visible questions)
+                with metrics.timed('filler.validate'):
+                    errors = get_validator(form_data).validate(answers)
+                show_answer_errors(errors)
                 
-                if valid:
+                if not errors:
+                    answers = get_validator(form_data).coerce(answers)
                     # Calculate screening status
                     settings = form_data.get('settings', {})
                     if settings.get('enable_screening', False):
                         status = calculate_screening_status(answers, len(form_data['questions']))
                         st.session_state[f'screening_status_{form_id}'] = status
                     
-                    save_response(form_id, answers)
+                    submit_response(form_id, answers, form_data['version'])
+                    discard_filler_draft(form_id)
                     st.success(settings.get('custom_message', 'Thank you for your response!'))
                     
                     # Show screening status if enabled
@@ -946,8 +944,15 @@ def show_form_filler():
                     # Clear form data
                     if f'answers_{form_id}' in st.session_state:
                         del st.session_state[f'answers_{form_id}']
+                    st.session_state.pop(f'visible_{form_id}', None)
+                    st.session_state.pop(f'hidden_{form_id}', None)
+                    st.session_state.pop(f'pages_{form_id}', None)
+                    st.session_state.pop(f'version_{form_id}', None)
 
 def show_responses_viewer():
+    import pandas as pd
+    from exporters import EXPORT_FORMATS, export_link, export_responses, export_responses_csv
+    
     st.header("📊 Response Viewer & Analytics")
     
     # Form selector
@@ -961,152 +966,119 @@ def show_responses_viewer():
     
     if selected_form_title:
         form_id = form_options[selected_form_title]
-        form_data = load_form(form_id)
-        responses = get_form_responses(form_id)
+        form_data = get_form_definition(form_id)
+        metrics.tag_rerun(form_id)
+        summary = get_form_summary(form_data)
+        total_responses = summary['total_responses']
         
         # Analytics overview
         st.subheader("📈 Analytics Overview")
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Responses", len(responses))
+            st.metric("Total Responses", total_responses)
         
         with col2:
             if form_data['settings'].get('enable_screening', False):
-                passed = len([r for r in responses if calculate_screening_status(r['answers'], len(form_data['questions'])) == "Passed"])
-                st.metric("Passed", passed)
+                st.metric("Passed", summary['passed'])
             else:
-                complete_responses = len([r for r in responses if len(r['answers']) == len(form_data['questions'])])
-                st.metric("Complete", complete_responses)
+                st.metric("Complete", summary['complete'])
         
         with col3:
-            if responses:
+            if total_responses:
                 if form_data['settings'].get('enable_screening', False):
-                    passed = len([r for r in responses if calculate_screening_status(r['answers'], len(form_data['questions'])) == "Passed"])
-                    pass_rate = (passed / len(responses)) * 100
+                    pass_rate = (summary['passed'] / total_responses) * 100
                     st.metric("Pass Rate", f"{pass_rate:.1f}%")
                 else:
-                    complete_responses = len([r for r in responses if len(r['answers']) == len(form_data['questions'])])
-                    completion_rate = (complete_responses / len(responses)) * 100
+                    completion_rate = (summary['complete'] / total_responses) * 100
                     st.metric("Completion Rate", f"{completion_rate:.1f}%")
         
         with col4:
-            if responses:
-                avg_questions = sum(len(r['answers']) for r in responses) / len(responses)
-                st.metric("Avg Questions Answered", f"{avg_questions:.1f}")
+            if total_responses:
+                st.metric("Avg Questions Answered", f"{summary['avg_answered']:.1f}")
+        
+        # Responses per published version, when the form has been republished
+        version_counts = count_responses_by_version(form_data['id']) if total_responses else []
+        if len(version_counts) > 1:
+            with st.expander("🗂️ Responses by Form Version"):
+                for version_number, version_hash, count in version_counts:
+                    if version_number:
+                        st.write(f"**Version {version_number}** (`{version_hash}`): {count}")
+                    else:
+                        st.write(f"**Before versioning:** {count}")
         
         # Question-by-question analysis
-        if responses and form_data['questions']:
+        section_started = time.perf_counter()
+        if total_responses and form_data['questions']:
             st.subheader("📊 Question Analysis")
             
             for i, question in enumerate(form_data['questions']):
+                question_summary = summary['questions'][i]
                 with st.expander(f"Question {i+1}: {question['text'][:60]}..."):
-                    # Get all answers for this question
-                    question_answers = [r['answers'].get(str(i), '') for r in responses if str(i) in r['answers']]
+                    response_count = question_summary['response_count']
                     
                     col1, col2 = st.columns([2, 1])
                     
                     with col2:
-                        st.metric("Response Count", len(question_answers))
+                        st.metric("Response Count", response_count)
                         if question['required']:
                             st.metric("Required", "✅ Yes")
                         else:
                             st.metric("Required", "❌ No")
                     
                     with col1:
-                        if question['type'] in ['multiple-choice', 'dropdown', 'likert-scale']:
-                            # Count frequency of each option
-                            answer_counts = {}
-                            for ans in question_answers:
-                                if ans:
-                                    answer_counts[ans] = answer_counts.get(ans, 0) + 1
-                            
-                            if answer_counts:
-                                import pandas as pd
-                                df = pd.DataFrame(list(answer_counts.items()), columns=['Option', 'Count'])
-                                df['Percentage'] = (df['Count'] / len(question_answers) * 100).round(1)
-                                st.dataframe(df, use_container_width=True)
-                                
-                                # Simple bar chart
-                                st.bar_chart(df.set_index('Option')['Count'])
-                        
-                        elif question['type'] == 'checkboxes':
-                            # Handle multiple selections
-                            all_options = set()
-                            for ans in question_answers:
-                                if isinstance(ans, list):
-                                    all_options.update(ans)
-                                elif ans:
-                                    all_options.add(ans)
-                            
-                            option_counts = {}
-                            for option in all_options:
-                                count = sum(1 for ans in question_answers 
-                                          if (isinstance(ans, list) and option in ans) or ans == option)
-                                option_counts[option] = count
+                        if 'option_counts' in question_summary:
+                            # Frequency of each option (checkboxes count each selected option)
+                            option_counts = question_summary['option_counts']
                             
                             if option_counts:
                                 df = pd.DataFrame(list(option_counts.items()), columns=['Option', 'Count'])
-                                df['Percentage'] = (df['Count'] / len(question_answers) * 100).round(1)
+                                df['Percentage'] = (df['Count'] / response_count * 100).round(1)
                                 st.dataframe(df, use_container_width=True)
+                                
+                                # Simple bar chart
                                 st.bar_chart(df.set_index('Option')['Count'])
                         
-                        elif question['type'] in ['number', 'scale']:
-                            numeric_answers = [float(ans) for ans in question_answers if ans and str(ans).replace('.','').replace('-','').isdigit()]
-                            if numeric_answers:
-                                st.metric("Average", f"{sum(numeric_answers) / len(numeric_answers):.2f}")
-                                st.metric("Min/Max", f"{min(numeric_answers)} / {max(numeric_answers)}")
+                        elif 'numeric' in question_summary:
+                            numeric = question_summary['numeric']
+                            if numeric['count']:
+                                st.metric("Average", f"{numeric['mean']:.2f}")
+                                st.metric("Min/Max", f"{numeric['min']} / {numeric['max']}")
                                 
-                                # Simple histogram using bar chart
-                                df = pd.DataFrame({'Values': numeric_answers})
-                                st.line_chart(df)
+                                # Value distribution
+                                df = pd.DataFrame(list(numeric['distribution'].items()), columns=['Value', 'Count'])
+                                st.bar_chart(df.set_index('Value')['Count'])
                         
                         else:
                             # Text responses - show word count stats
-                            text_lengths = [len(str(ans).split()) for ans in question_answers if ans]
-                            if text_lengths:
-                                st.metric("Avg Words", f"{sum(text_lengths) / len(text_lengths):.1f}")
-                                st.metric("Response Rate", f"{len(text_lengths) / len(responses) * 100:.1f}%")
+                            text = question_summary['text']
+                            if text['answered']:
+                                st.metric("Avg Words", f"{text['avg_words']:.1f}")
+                                st.metric("Response Rate", f"{text['answered'] / total_responses * 100:.1f}%")
+        
+        metrics.observe('viewer.question_analysis', time.perf_counter() - section_started)
         
         # Export functionality
-        if responses:
+        if total_responses:
             st.subheader("📥 Export Data")
             
             col1, col2 = st.columns(2)
             
             with col1:
-                if st.button("📄 Export Responses as CSV", use_container_width=True):
-                    # Create detailed DataFrame
-                    export_data = []
-                    for r in responses:
-                        row = {
-                            'Response ID': r['id'],
-                            'Submitted At': r['submitted_at'],
-                        }
-                        
-                        # Add screening status if enabled
-                        if form_data['settings'].get('enable_screening', False):
-                            row['Screening Status'] = calculate_screening_status(r['answers'], len(form_data['questions']))
-                        
-                        # Add answers
-                        for i, question in enumerate(form_data['questions']):
-                            answer = r['answers'].get(str(i), '')
-                            if isinstance(answer, list):
-                                answer = ', '.join(answer)
-                            row[f"Q{i+1}: {question['text'][:50]}"] = answer
-                        
-                        export_data.append(row)
-                    
-                    df = pd.DataFrame(export_data)
-                    csv = df.to_csv(index=False)
-                    
-                    st.download_button(
-                        label="💾 Download CSV",
-                        data=csv,
-                        file_name=f"responses_{form_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
+                csv_link = export_link(API_URL, form_id, 'csv')
+                if csv_link:
+                    # Streamed by the API batch by batch; the link is signed and expires
+                    st.link_button("📄 Download Responses as CSV", csv_link, use_container_width=True)
+                elif st.button("📄 Export Responses as CSV", use_container_width=True):
+                    # Stream rows into a temporary file page by page
+                    with export_responses_csv(form_data) as csv_file:
+                        st.download_button(
+                            label="💾 Download CSV",
+                            data=csv_file,
+                            file_name=f"responses_{form_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                            mime="text/csv",
+                            use_container_width=True
+                        )
             
             with col2:
                 if st.button("📊 Export Analytics Summary", use_container_width=True):
@@ -1115,15 +1087,15 @@ def show_responses_viewer():
                         'Form Title': [form_data['title']],
                         'Form ID': [form_id],
                         'Total Questions': [len(form_data['questions'])],
-                        'Total Responses': [len(responses)],
+                        'Total Responses': [total_responses],
                         'Screening Enabled': [form_data['settings'].get('enable_screening', False)],
                         'Export Date': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
                     }
                     
                     if form_data['settings'].get('enable_screening', False):
-                        passed = len([r for r in responses if calculate_screening_status(r['answers'], len(form_data['questions'])) == "Passed"])
+                        passed = summary['passed']
                         summary_data['Passed Responses'] = [passed]
-                        summary_data['Pass Rate %'] = [f"{(passed / len(responses) * 100):.1f}" if responses else "0"]
+                        summary_data['Pass Rate %'] = [f"{(passed / total_responses * 100):.1f}" if total_responses else "0"]
                     
                     df = pd.DataFrame(summary_data)
                     csv = df.to_csv(index=False)
@@ -1135,9 +1107,36 @@ def show_responses_viewer():
                         mime="text/csv",
                         use_container_width=True
                     )
+            
+            # Typed exports (one column per question) for analytics pipelines
+            st.write("**Typed Exports:**")
+            typed_formats = [
+                ("🧾 JSON Lines", 'jsonl'),
+                ("🗂️ Parquet", 'parquet'),
+                ("🏹 Arrow IPC", 'arrow'),
+            ]
+            for col, (label, export_format) in zip(st.columns(len(typed_formats)), typed_formats):
+                with col:
+                    link = export_link(API_URL, form_id, export_format)
+                    if link:
+                        st.link_button(label, link, use_container_width=True)
+                    elif st.button(label, key=f"export_{export_format}", use_container_width=True):
+                        try:
+                            with export_responses(form_data, export_format) as export_file:
+                                st.download_button(
+                                    label=f"💾 Download {export_format.upper()}",
+                                    data=export_file,
+                                    file_name=f"responses_{form_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+                                    mime=EXPORT_FORMATS[export_format][2],
+                                    key=f"download_{export_format}",
+                                    use_container_width=True
+                                )
+                        except ImportError as e:
+                            st.error(str(e))
         
         # Individual responses
-        if responses:
+        section_started = time.perf_counter()
+        if total_responses:
             st.subheader("📋 Individual Responses")
             
             # Filter options
@@ -1151,21 +1150,32 @@ def show_responses_viewer():
             with col2:
                 sort_order = st.selectbox("Sort by:", ["Newest First", "Oldest First"])
             
-            # Apply filters
-            filtered_responses = responses.copy()
+            # Keyset pagination: remember where each page starts, reset when the view changes
+            view = (form_id, status_filter, sort_order)
+            if st.session_state.get('responses_view') != view:
+                st.session_state.responses_view = view
+                st.session_state.responses_page_starts = [None]
+            page_starts = st.session_state.responses_page_starts
+            page = len(page_starts) - 1
             
-            if status_filter != "All":
-                filtered_responses = [
-                    r for r in filtered_responses 
-                    if calculate_screening_status(r['answers'], len(form_data['questions'])) == status_filter
-                ]
+            if status_filter == "All":
+                filtered_total = total_responses
+            else:
+                filtered_total = summary[status_filter.lower()]
+            total_pages = max(1, -(-filtered_total // RESPONSES_PAGE_SIZE))
             
-            if sort_order == "Oldest First":
-                filtered_responses.reverse()
+            page_responses = get_response_page(
+                form_id,
+                len(form_data['questions']),
+                status=None if status_filter == "All" else status_filter,
+                newest_first=sort_order == "Newest First",
+                after=page_starts[-1],
+                limit=RESPONSES_PAGE_SIZE
+            )
             
             # Show responses
-            for i, response in enumerate(filtered_responses):
-                with st.expander(f"Response #{i+1} - {response['submitted_at'][:16]}"):
+            for i, response in enumerate(page_responses):
+                with st.expander(f"Response #{page * RESPONSES_PAGE_SIZE + i + 1} - {response['submitted_at'][:16]}"):
                     
                     # Status indicator
                     if form_data['settings'].get('enable_screening', False):
@@ -1181,7 +1191,7 @@ def show_responses_viewer():
                     # Show answers
                     answered_count = 0
                     for j, question in enumerate(form_data['questions']):
-                        answer = response['answers'].get(str(j), 'No answer')
+                        answer = response['answers'].get(question['id'], 'No answer')
                         
                         if answer and answer != 'No answer':
                             answered_count += 1
@@ -1197,9 +1207,25 @@ def show_responses_viewer():
                     
                     # Response metadata
                     st.caption(f"Answered {answered_count}/{len(form_data['questions'])} questions • Response ID: {response['id']}")
+            
+            # Page navigation
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("⬅️ Previous", disabled=page == 0, use_container_width=True):
+                    page_starts.pop()
+                    st.rerun()
+            with col2:
+                st.caption(f"Page {page + 1} of {total_pages} • {filtered_total} response(s)")
+            with col3:
+                has_next = len(page_responses) == RESPONSES_PAGE_SIZE and page + 1 < total_pages
+                if st.button("Next ➡️", disabled=not has_next, use_container_width=True):
+                    last = page_responses[-1]
+                    page_starts.append((last['submitted_at'], last['id']))
+                    st.rerun()
         
         else:
             st.info("No responses received yet. Share your form to start collecting responses!")
+        metrics.observe('viewer.responses', time.perf_counter() - section_started)
 
 # Demo option hiding button
         if st.button("🎯 Create Demo Form with Option Hiding", use_container_width=True):
@@ -1260,5 +1286,66 @@ def show_responses_viewer():
             st.info("📝 **How to test:**\n1. Go to 'Fill Form' mode\n2. Select different programming languages in question 1\n3. Watch how the framework options in question 2 change!")
             st.rerun()
     
+def show_performance_panel(record):
+    """Timings of this session's last reruns and the process-wide totals"""
+    history = st.session_state.setdefault('perf_history', deque(maxlen=PERF_HISTORY))
+    history.append(record)
+    
+    with st.sidebar.expander("⏱️ Performance"):
+        st.caption(f"Last {len(history)} rerun(s), newest first")
+        rows = []
+        for rerun in reversed(history):
+            spans = sorted(rerun['spans'].items(), key=lambda item: item[1][1], reverse=True)
+            rows.append({
+                'Mode': rerun['mode'],
+                'Form': rerun['form_id'] or '',
+                'Total ms': round(rerun['total'] * 1000, 1),
+                'Slowest operations': ', '.join(
+                    f"{name} {seconds * 1000:.1f} ms ×{count}" for name, (count, seconds) in spans[:3]
+                ),
+            })
+        st.table(rows)
+        
+        st.write("**Process totals:**")
+        totals = sorted(metrics.snapshot().items(), key=lambda item: item[1][1], reverse=True)
+        st.table([{
+            'Operation': name + ''.join(f" {key}={value}" for key, value in labels if value),
+            'Calls': count,
+            'Mean ms': round(seconds / count * 1000, 2),
+            'Total s': round(seconds, 3),
+        } for (name, labels), (count, seconds) in totals[:15]])
+        st.download_button("💾 Download metrics", metrics.render_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
+
+def show_profiling_panel(capture):
+    """Download links for the latest profiles (FORMS_PROFILE=1)"""
+    with st.sidebar.expander("🔬 Profiling"):
+        if capture:
+            st.caption(f"This rerun was profiled: {capture['elapsed'] * 1000:.1f} ms")
+        st.caption(f"Add ?profile=1 to the URL to profile every rerun; captures are kept in {profiling.PROFILE_DIR}/")
+        for path in profiling.recent_captures(limit=5):
+            name = os.path.basename(path)
+            try:
+                with open(path + '.txt', 'rb') as f:
+                    report = f.read()
+                with open(path + '.pstats', 'rb') as f:
+                    stats = f.read()
+            except FileNotFoundError:
+                # Rotated away by another session's capture
+                continue
+            st.write(f"`{name}`")
+            col1, col2 = st.columns(2)
+            col1.download_button("📄 Report", report, file_name=name + '.txt',
+                                 mime="text/plain", key=f"profile_report_{name}")
+            col2.download_button("📊 pstats", stats, file_name=name + '.pstats',
+                                 mime="application/octet-stream", key=f"profile_pstats_{name}")
+
 if __name__ == "__main__":
-    main()
+    mode = st.session_state.get('mode_selector', '')
+    profile = profiling.ENABLED and profiling.should_profile(st.query_params.get('profile') == '1')
+    with metrics.rerun(mode) as rerun_record, profiling.capture(mode, enabled=profile) as capture:
+        main()
+    if PERF_PANEL:
+        show_performance_panel(rerun_record)
+    if profiling.ENABLED:
+        show_profiling_panel(capture)
@@ -0,0 +1,337 @@
+"""Optional write-behind mode for form submissions
+
+With FORMS_WRITE_BEHIND=1, submit_response appends the submission to a local
+append-only spool file, queues it in memory and returns immediately. A
+background writer thread commits queued submissions in batches (up to
+FORMS_BATCH_SIZE rows, or whatever arrived within FORMS_FLUSH_INTERVAL
+seconds) with storage.save_responses_batch.
+
+Durability: a submission is in the spool before submit_response returns.
+Each process appends to its own spool, FORMS_SPOOL_PATH suffixed with its
+pid, and holds an exclusive flock on it while it runs. Entry points call
+start_submission_queue() at startup, which replays every spool no live
+process holds (left by crashed or stopped processes) into the database,
+even when write-behind has since been turned off, so a Streamlit server
+and an API server sharing a directory never replay or truncate each
+other's pending records. Replays are idempotent because inserts skip
+response ids that are already stored. A process truncates its spool
+whenever everything in it has been committed and removes it on a clean
+stop. Set FORMS_SPOOL_FSYNC=1 to fsync each append (survives power loss,
+not just process crashes). Without fcntl (Windows) spools aren't locked,
+so run a single process per spool path there.
+
+A batch that still fails after COMMIT_ATTEMPTS tries is retried one record
+at a time. Records that fail on their own are appended to
+FORMS_DEAD_LETTER_PATH (same line format as the spool) and logged, so one
+bad record doesn't hold up every later submission. To retry them, append
+the file to the spool and restart.
+
+Without FORMS_WRITE_BEHIND, submit_response is storage.save_response.
+"""
+import os
+import glob
+import json
+import uuid
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import storage
+from question_ids import encode_answers
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND = os.environ.get('FORMS_WRITE_BEHIND', '') == '1'
+SPOOL_PATH = os.environ.get('FORMS_SPOOL_PATH', 'responses.spool')
+BATCH_SIZE = int(os.environ.get('FORMS_BATCH_SIZE', '500'))
+FLUSH_INTERVAL = float(os.environ.get('FORMS_FLUSH_INTERVAL', '0.5'))
+SPOOL_FSYNC = os.environ.get('FORMS_SPOOL_FSYNC', '') == '1'
+DEAD_LETTER_PATH = os.environ.get('FORMS_DEAD_LETTER_PATH', 'responses.dead')
+RETRY_DELAY = 1.0
+COMMIT_ATTEMPTS = 5
+
+
+def _lock_spool(spool):
+    """Take the exclusive lock on an open spool file; False if another process holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _remove_spool(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Another process replayed and removed it first
+        pass
+
+
+class SubmissionQueue:
+    """In-process queue of submissions committed by a background writer thread"""
+
+    def __init__(self, spool_path=SPOOL_PATH, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, fsync=SPOOL_FSYNC, dead_letter_path=DEAD_LETTER_PATH):
+        # Spools of every process share this prefix; this process writes only its own
+        self.spool_prefix = spool_path
+        self.spool_path = f"{spool_path}.{os.getpid()}"
+        self.dead_letter_path = dead_letter_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._queue = queue.Queue()
+        # Guards the spool file and the count of submissions not yet committed
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._spool = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Replay any spooled submissions left by a previous process, then start the writer"""
+        if self._thread is not None:
+            return self
+        self.replay_spool()
+        self._spool = self._open_own_spool()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def _open_own_spool(self):
+        while True:
+            spool = open(self.spool_path, 'a', encoding='utf-8')
+            if not _lock_spool(spool):
+                spool.close()
+                raise RuntimeError(f"Spool {self.spool_path} is locked by another process")
+            try:
+                same_file = os.path.samestat(os.fstat(spool.fileno()), os.stat(self.spool_path))
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                return spool
+            # Another process's replay removed the file between open and lock
+            spool.close()
+
+    def _spool_paths(self):
+        prefix = glob.escape(self.spool_prefix)
+        # The bare prefix is the spool of versions that didn't suffix it
+        return sorted(set(glob.glob(prefix) + glob.glob(prefix + '.*')))
+
+    def replay_spool(self):
+        """Commit the records of every spool not held by a live process and delete those spools
+
+        Returns rows inserted.
+        """
+        inserted = 0
+        for path in self._spool_paths():
+            if path == self.spool_path and self._spool is not None:
+                continue
+            try:
+                spool = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with spool:
+                if not _lock_spool(spool):
+                    # Its process is still running and will commit the records itself
+                    continue
+                inserted += self._replay_file(path, spool)
+                # Emptied under the lock, so a process that opens it next finds nothing to replay
+                spool.truncate(0)
+            _remove_spool(path)
+        return inserted
+
+    def _replay_file(self, path, spool):
+        records = []
+        for line in spool:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-append
+                logger.warning("Skipping unreadable spool line in %s", path)
+
+        inserted = 0
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            try:
+                inserted += storage.save_responses_batch(batch)
+            except Exception:
+                logger.exception("Replaying %d spooled submission(s) failed", len(batch))
+                inserted += self._save_each(batch)
+
+        if records:
+            logger.info("Replayed %d spooled submission(s) from %s, %d new", len(records), path, inserted)
+        return inserted
+
+    def submit(self, form_id, answers, form_version=None):
+        """Spool and enqueue a submission; returns its response id"""
+        # Key answers by question id now, against the form version being answered
+        if form_version:
+            form = storage.get_form_version(form_id, form_version)
+        else:
+            form = storage.get_form_definition(form_id)
+        if form is not None:
+            answers = encode_answers(form['questions'], answers)
+
+        record = {
+            'id': str(uuid.uuid4()),
+            'form_id': form_id,
+            'form_version': form_version,
+            # Round-trip through JSON now so the queued record matches the spooled one
+            'answers': json.loads(json.dumps(answers)),
+            'submitted_at': str(datetime.now()),
+        }
+        line = json.dumps(record) + '\n'
+
+        with self._lock:
+            self._spool.write(line)
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._uncommitted += 1
+            self._queue.put(record)
+        return record['id']
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dead_letter(self, records):
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as dead_letters:
+            for record in records:
+                dead_letters.write(json.dumps(record) + '\n')
+            dead_letters.flush()
+            if self.fsync:
+                os.fsync(dead_letters.fileno())
+        logger.error("Moved %d submission(s) that could not be saved to %s",
+                     len(records), self.dead_letter_path)
+
+    def _save_each(self, batch):
+        """Save records one at a time, dead-lettering those that fail; returns rows inserted"""
+        inserted = 0
+        failed = []
+        for record in batch:
+            try:
+                inserted += storage.save_responses_batch([record])
+            except Exception:
+                logger.exception("Saving submission %s failed", record.get('id'))
+                failed.append(record)
+        if failed:
+            self._dead_letter(failed)
+        return inserted
+
+    def _commit(self, batch):
+        for attempt in range(1, COMMIT_ATTEMPTS + 1):
+            try:
+                storage.save_responses_batch(batch)
+                break
+            except Exception:
+                # Records stay in the spool, so retry transient failures (e.g. a locked database)
+                logger.exception("Committing %d submission(s) failed (attempt %d of %d)",
+                                 len(batch), attempt, COMMIT_ATTEMPTS)
+                if self._stopping.wait(RETRY_DELAY):
+                    return False
+        else:
+            # Keep the batch's good records and set the bad ones aside
+            self._save_each(batch)
+
+        with self._lock:
+            self._uncommitted -= len(batch)
+            if self._uncommitted == 0:
+                # Everything spooled so far is in the database
+                self._spool.truncate(0)
+                self._spool.seek(0)
+        return True
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch and not self._commit(batch):
+                return
+
+    def flush(self, timeout=None):
+        """Block until every submission queued so far is committed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._uncommitted == 0:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def stop(self, timeout=10.0):
+        """Drain the queue and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # The writer still uses the spool; it stays open (and locked) until the process exits
+            logger.warning("Submission writer still running after %.1f s; leaving %s in place",
+                           timeout, self.spool_path)
+            return
+        self._thread = None
+        with self._lock:
+            self._spool.close()
+            self._spool = None
+            if self._uncommitted == 0:
+                _remove_spool(self.spool_path)
+
+
+_submission_queue = None
+_submission_queue_lock = threading.Lock()
+
+
+def get_submission_queue():
+    """Process-wide queue, started on first use and drained at exit"""
+    global _submission_queue
+    if _submission_queue is None:
+        with _submission_queue_lock:
+            if _submission_queue is None:
+                _submission_queue = SubmissionQueue().start()
+                atexit.register(_submission_queue.stop)
+    return _submission_queue
+
+
+def start_submission_queue():
+    """Recover spooled submissions at startup, starting the writer if write-behind is on
+
+    Without write-behind, a spool left by an earlier write-behind process is
+    still replayed so those submissions aren't stranded.
+    """
+    if WRITE_BEHIND:
+        return get_submission_queue()
+    return SubmissionQueue().replay_spool()
+
+
+def submit_response(form_id, answers, form_version=None):
+    """Save a submission, through the write-behind queue when it is enabled"""
+    if WRITE_BEHIND:
+        return get_submission_queue().submit(form_id, answers, form_version)
+    return storage.save_response(form_id, answers, form_version)
@@ -0,0 +1,30 @@
+"""Number and scale checks reject non-finite input instead of crashing or storing it"""
+import pytest
+
+from validation import FormValidator
+
+
+def make_validator(question):
+    return FormValidator({'id': None, 'questions': [question], 'settings': {}})
+
+
+@pytest.mark.parametrize('answer', ['inf', '-inf', 'nan', float('inf'), float('nan')])
+def test_number_rejects_non_finite(answer):
+    validator = make_validator({'id': 'q1', 'type': 'number', 'text': "How many?"})
+    assert validator.validate({0: answer}) == {0: "Please enter a number"}
+
+
+@pytest.mark.parametrize('answer', ['inf', '-inf', 'nan', float('inf'), float('nan')])
+def test_scale_rejects_non_finite(answer):
+    validator = make_validator({'id': 'q1', 'type': 'scale', 'text': "Rate it",
+                                'options': [str(i) for i in range(1, 6)]})
+    assert validator.validate({0: answer}) == {0: "Please choose a whole number from 1 to 5"}
+
+
+def test_number_and_scale_accept_finite():
+    validator = FormValidator({'id': None, 'settings': {}, 'questions': [
+        {'id': 'q1', 'type': 'number', 'text': "How many?"},
+        {'id': 'q2', 'type': 'scale', 'text': "Rate it", 'options': ['1', '2', '3']},
+    ]})
+    assert validator.validate({0: '2.5', 1: '3'}) == {}
+    assert validator.coerce({0: '2.5', 1: '3'}) == {0: 2.5, 1: 3}
@@ -0,0 +1,245 @@
+"""Answer validation shared by the Streamlit filler, the JSON API and bulk imports
+
+A FormValidator is compiled once per form version: every question gets a
+small checker chosen by its type (email format, numeric value and bounds,
+scale range, option membership), so validating an answer dict is a single
+pass over the answers plus the required-field check on visible questions.
+"""
+import re
+import math
+
+from form_logic import get_compiled_logic
+from question_ids import CHOICE_TYPES, question_index_by_id
+from cache import FormCache, form_cache_key
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+REQUIRED_MESSAGE = "This question is required"
+
+
+def _is_empty(answer):
+    return answer is None or answer == '' or answer == []
+
+
+def _as_number(answer):
+    """Finite float value of an answer, or None
+
+    inf and nan are not numbers here: they can't be compared with bounds or
+    converted to int, and JSON1 rejects the Infinity/NaN they serialize to.
+    """
+    if isinstance(answer, bool):
+        return None
+    if isinstance(answer, (int, float)):
+        number = float(answer)
+    elif isinstance(answer, str):
+        try:
+            number = float(answer)
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def normalize_answer_keys(answers, index_by_id=None):
+    """Answers keyed by integer question index
+
+    Accepts numeric-string indexes and, given index_by_id, question ids
+    (the stored answer format).
+    """
+    normalized = {}
+    for key, value in answers.items():
+        if isinstance(key, str):
+            if index_by_id and key in index_by_id:
+                key = index_by_id[key]
+            elif key.lstrip('-').isdigit():
+                key = int(key)
+        normalized[key] = value
+    return normalized
+
+
+# Per-type checkers: return an error message or None
+def _check_email(answer, question):
+    if not isinstance(answer, str) or not EMAIL_PATTERN.match(answer.strip()):
+        return "Please enter a valid email address"
+    return None
+
+
+def _number_checker(question):
+    minimum = _as_number(question.get('min'))
+    maximum = _as_number(question.get('max'))
+
+    def check(answer, question):
+        number = _as_number(answer)
+        if number is None:
+            return "Please enter a number"
+        if minimum is not None and number < minimum:
+            return f"Must be at least {question['min']}"
+        if maximum is not None and number > maximum:
+            return f"Must be at most {question['max']}"
+        return None
+    return check
+
+
+def _scale_checker(question):
+    options = question.get('options', [str(i) for i in range(1, 11)])
+    try:
+        minimum, maximum = int(options[0]), int(options[-1])
+    except (ValueError, IndexError):
+        return None
+
+    def check(answer, question):
+        number = _as_number(answer)
+        if number is None or number != int(number) or not minimum <= number <= maximum:
+            return f"Please choose a whole number from {minimum} to {maximum}"
+        return None
+    return check
+
+
+def _choice_checker(question):
+    options = set(question.get('options', []))
+
+    def check(answer, question):
+        if not isinstance(answer, str) or answer not in options:
+            return "Please choose one of the listed options"
+        return None
+    return check
+
+
+def _checkbox_checker(question):
+    options = set(question.get('options', []))
+
+    def check(answer, question):
+        if not isinstance(answer, list) or not all(isinstance(a, str) and a in options for a in answer):
+            return "Please choose from the listed options"
+        return None
+    return check
+
+
+def _check_text(answer, question):
+    if not isinstance(answer, str):
+        return "Please enter text"
+    return None
+
+
+def _checker_for(question):
+    q_type = question['type']
+    if q_type == 'email':
+        return _check_email
+    if q_type == 'number':
+        return _number_checker(question)
+    if q_type == 'scale':
+        return _scale_checker(question)
+    if q_type in CHOICE_TYPES:
+        return _choice_checker(question)
+    if q_type == 'checkboxes':
+        return _checkbox_checker(question)
+    if q_type in ('short-text', 'paragraph'):
+        return _check_text
+    # Grids and other types are stored as given
+    return None
+
+
+class FormValidator:
+    """Validator for one form version"""
+
+    def __init__(self, form):
+        self.form = form
+        self.questions = form['questions']
+        self.checkers = [_checker_for(q) for q in self.questions]
+        self.index_by_id = question_index_by_id(self.questions)
+        self.logic = get_compiled_logic(form)
+
+    def _answer_index(self, key):
+        if isinstance(key, str):
+            if key in self.index_by_id:
+                return self.index_by_id[key]
+            if key.lstrip('-').isdigit():
+                return int(key)
+        return key
+
+    def normalize(self, answers):
+        """Copy of answers without selections of options that other answers hide
+
+        An answer can go stale when an earlier answer changes afterwards (the
+        filler only stops displaying it). Such answers are dropped rather than
+        rejected, as the respondent can no longer see or clear them. Keys are
+        kept as given.
+        """
+        key_by_index = {self._answer_index(key): key for key in answers}
+        by_index = {index: answers[key] for index, key in key_by_index.items()}
+        rules = self.logic.option_rules
+        _, changed = rules.drop_hidden_answers(by_index, rules.hidden_options(by_index))
+        if not changed:
+            return dict(answers)
+        return {key: by_index[index] for index, key in key_by_index.items() if index in by_index}
+
+    def validate(self, answers):
+        """Map question index -> error message for an answer dict (empty when valid)
+
+        answers may be keyed by question index or question id. Selections of
+        hidden options are dropped first (see normalize), and required
+        questions are enforced only for questions that skip logic leaves visible.
+        """
+        answers = self.normalize(normalize_answer_keys(answers, self.index_by_id))
+        errors = {}
+        num_questions = len(self.questions)
+        visible = self.logic.skip_logic.visible_questions(answers)
+
+        for question_idx, answer in answers.items():
+            if not isinstance(question_idx, int) or not 0 <= question_idx < num_questions:
+                errors[question_idx] = "Unknown question"
+                continue
+            if _is_empty(answer):
+                continue
+
+            checker = self.checkers[question_idx]
+            message = checker(answer, self.questions[question_idx]) if checker else None
+            if message:
+                errors[question_idx] = message
+
+        for question_idx in visible:
+            question = self.questions[question_idx]
+            if question.get('required') and not answers.get(question_idx) and question_idx not in errors:
+                errors[question_idx] = REQUIRED_MESSAGE
+
+        return errors
+
+    def validate_batch(self, answer_dicts):
+        """Errors for many responses; returns [(position, errors)] for the invalid ones"""
+        invalid = []
+        for position, answers in enumerate(answer_dicts):
+            errors = self.validate(answers)
+            if errors:
+                invalid.append((position, errors))
+        return invalid
+
+    def coerce(self, answers):
+        """Normalized copy of valid answers with numeric strings for number/scale questions stored as numbers"""
+        coerced = self.normalize(answers)
+        for question_idx, answer in list(coerced.items()):
+            if not isinstance(answer, str) or answer == '':
+                continue
+            index = self.index_by_id[question_idx] if question_idx in self.index_by_id else int(question_idx)
+            q_type = self.questions[index]['type']
+            if q_type == 'number':
+                coerced[question_idx] = float(answer)
+            elif q_type == 'scale':
+                coerced[question_idx] = int(float(answer))
+        return coerced
+
+
+_validator_cache = FormCache()
+
+
+def get_validator(form):
+    """Compiled validator for a form, cached per form version (see cache.form_cache_key)"""
+    cache_key = form_cache_key(form)
+    if cache_key is None:
+        return FormValidator(form)
+
+    validator = _validator_cache.get(*cache_key)
+    if validator is None:
+        validator = FormValidator(form)
+        _validator_cache.put(*cache_key, validator)
+    return validator